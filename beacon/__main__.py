@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import logging
 import os
@@ -19,7 +20,7 @@ from beacon import conf, load_logger
 from beacon.request import ontologies
 from beacon.response import middlewares
 from beacon.request.routes import routes
-from beacon.db import client
+from beacon.db import advisor, catalog, check_topology, client, linkage, measures, ontology_index, selectivity, trigrams
 
 LOG = logging.getLogger(__name__)
 
@@ -41,12 +42,62 @@ async def initialize(app):
 
     setattr(conf, 'update_datetime', datetime.now().isoformat())
 
+    # Report the MongoDB topology the reads will be routed to
+    try:
+        await check_topology()
+    except Exception as e:
+        LOG.error("Could not reach the database: {}".format(e))
+
+    # Paths of the filtering terms, the alphanumeric filters are looked for in every field without them
+    try:
+        await catalog.load()
+    except Exception as e:
+        LOG.error("Could not load the field catalog: {}".format(e))
+
+    # Statistics of the filtering terms and the collections, to hint the most selective index
+    try:
+        await selectivity.load()
+    except Exception as e:
+        LOG.error("Could not load the selectivity statistics: {}".format(e))
+
+    # Build the linkage index in the background, the joins are used until it is ready
+    if conf.linkage_index_enabled:
+        app["linkage_index"] = asyncio.create_task(linkage.run())
+
+    # Build the ontology index in the background, the ontology filters use $text until it is ready
+    if conf.ontology_index_enabled:
+        app["ontology_index"] = asyncio.create_task(ontology_index.run())
+
+    # Build the trigram index in the background, the LIKE filters scan the collection until it is ready
+    if conf.trigram_index_enabled:
+        app["trigram_index"] = asyncio.create_task(trigrams.run())
+
+    # Build the measures index in the background, the numeric filters use $elemMatch until it is ready
+    if conf.measures_index_enabled:
+        app["measures_index"] = asyncio.create_task(measures.run())
+
+    # Store the query shapes seen by this worker for the index advisor
+    if advisor.is_enabled():
+        app["index_advisor"] = asyncio.create_task(advisor.run())
+
     LOG.info("Initialization done.")
 
 
 async def destroy(app):
     """Upon server close, close the DB connections."""
     LOG.info("Shutting down.")
+    if "linkage_index" in app:
+        app["linkage_index"].cancel()
+    if "trigram_index" in app:
+        app["trigram_index"].cancel()
+    if "ontology_index" in app:
+        app["ontology_index"].cancel()
+    if "measures_index" in app:
+        app["measures_index"].cancel()
+    if "index_advisor" in app:
+        app["index_advisor"].cancel()
+        # Wait for the last flush
+        await asyncio.gather(app["index_advisor"], return_exceptions=True)
     client.close()
 
 
@@ -1,11 +1,94 @@
-from pymongo.mongo_client import MongoClient
+import logging
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+
 from beacon import conf
 
-client = MongoClient("mongodb://{}:{}@{}:{}/{}?authSource={}".format(
+LOG = logging.getLogger(__name__)
+
+
+def _read_preference(name: str):
+    # 'secondaryPreferred' -> SecondaryPreferred(), 'primary' -> Primary()
+    return make_read_preference(read_pref_mode_from_name(name), None)
+
+
+def _client_options() -> dict:
+    options = {
+        "minPoolSize": conf.database_min_pool_size,
+        "maxPoolSize": conf.database_max_pool_size,
+        "readPreference": conf.database_read_preference,
+        "readConcernLevel": conf.database_read_concern,
+        "serverSelectionTimeoutMS": conf.database_server_selection_timeout_ms,
+        "connectTimeoutMS": conf.database_connect_timeout_ms,
+    }
+    replica_set = conf.database_replica_set
+    if replica_set:
+        options["replicaSet"] = replica_set
+    compressors = conf.database_compressors
+    if compressors:
+        options["compressors"] = compressors
+    app_name = conf.database_app_name
+    if app_name:
+        options["appname"] = app_name
+    return options
+
+
+# database_host can be a comma-separated list of replica set members
+client = AsyncIOMotorClient("mongodb://{}:{}@{}/{}?authSource={}".format(
     conf.database_user,
     conf.database_password,
-    conf.database_host,
-    conf.database_port,
+    ",".join("{}:{}".format(host.strip(), conf.database_port) if ":" not in host else host.strip()
+             for host in str(conf.database_host).split(",")),
     conf.database_name,
     conf.database_auth_source
-))
+), **_client_options())
+
+_collection_options: Dict[str, dict] = {}
+
+
+def with_collection_options(collection: AsyncIOMotorCollection) -> AsyncIOMotorCollection:
+    """Applies the read preference and read concern configured for a collection, if any."""
+    overrides: Optional[dict] = conf.database_collection_options.get(collection.name)
+    if not overrides:
+        return collection
+    if collection.name not in _collection_options:
+        options = {}
+        if "read_preference" in overrides:
+            options["read_preference"] = _read_preference(overrides["read_preference"])
+        if "read_concern" in overrides:
+            options["read_concern"] = ReadConcern(overrides["read_concern"])
+        _collection_options[collection.name] = options
+    return collection.with_options(**_collection_options[collection.name])
+
+
+async def check_topology():
+    """Logs the topology the client is connected to (standalone, replica set members, sharded)."""
+    hello = await client.admin.command("hello")
+    if hello.get("msg") == "isdbgrid":
+        LOG.info("Connected to a sharded cluster through mongos {}".format(hello.get("me", conf.database_host)))
+    elif "setName" in hello:
+        LOG.info("Connected to replica set {}: primary {}, hosts {}, passives {}".format(
+            hello["setName"],
+            hello.get("primary"),
+            ", ".join(hello.get("hosts", [])),
+            ", ".join(hello.get("passives", [])) or "none"
+        ))
+        if len(hello.get("hosts", [])) < 2 and conf.database_read_preference != 'primary':
+            LOG.warning("Read preference is {} but the replica set has no secondaries".format(
+                conf.database_read_preference))
+    else:
+        LOG.info("Connected to a standalone server")
+        if conf.database_read_preference != 'primary':
+            LOG.warning("Read preference {} has no effect on a standalone server".format(
+                conf.database_read_preference))
+    LOG.info("Read preference: {}, read concern: {}, pool: {}-{}, compressors: {}".format(
+        conf.database_read_preference,
+        conf.database_read_concern,
+        conf.database_min_pool_size,
+        conf.database_max_pool_size,
+        conf.database_compressors or "none"
+    ))
+    return hello
@@ -0,0 +1,304 @@
+"""
+Index advisor.
+
+Records the shape of the queries built by ``apply_filters`` and ``apply_request_parameters``
+(the query with every value replaced by ``?``), with how often and how long they run.
+The shapes are flushed to the ``index_advisor_collection`` and aggregated offline into
+compound index proposals (equality fields first, then range fields), ranked by the time
+spent on the queries they would serve.
+
+Usage::
+
+    python -m beacon.db.advisor            # dry run: report the proposals, their plans and an estimate
+    python -m beacon.db.advisor --create   # create the proposed indexes
+    python -m beacon.db.advisor --json     # print the report as JSON
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+from pymongo import ASCENDING, UpdateOne
+
+from beacon import conf, load_logger
+from beacon.db import client
+from beacon.db.explain import explain as explain_command, summarize_plan
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+EQUALITY_OPERATORS = {'$eq', '$in'}
+RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte', '$regex'}
+# Compound indexes with more keys than this are rarely worth their write and memory cost
+MAX_INDEX_FIELDS = 4
+
+
+@dataclass
+class ShapeStats:
+    collection: str
+    shape: str
+    sample: str
+    count: int = 0
+    total_ms: float = 0
+    max_ms: float = 0
+
+
+@dataclass
+class IndexProposal:
+    collection: str
+    keys: List[Tuple[str, int]]
+    count: int = 0
+    total_ms: float = 0
+    shapes: List[str] = field(default_factory=list)
+    sample: Optional[str] = None
+    sample_ms: float = 0
+
+
+_shapes: Dict[Tuple[str, str], ShapeStats] = {}
+
+
+def is_enabled() -> bool:
+    return conf.index_advisor_enabled
+
+
+def query_shape(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in sorted(value.items())}
+    elif isinstance(value, list):
+        # Lists of values ($in, $all) have the shape of a single value,
+        # lists of clauses ($and, $or) keep the shape of each clause
+        if all(not isinstance(v, dict) for v in value):
+            return ['?']
+        return [query_shape(v) for v in value]
+    return '?'
+
+
+def record(collection: str, query: dict, elapsed_ms: float):
+    if not query:
+        return
+    shape = json.dumps(query_shape(query), sort_keys=True)
+    stats = _shapes.get((collection, shape))
+    if stats is None:
+        stats = _shapes[(collection, shape)] = ShapeStats(collection, shape, json_util.dumps(query))
+    stats.count += 1
+    stats.total_ms += elapsed_ms
+    stats.max_ms = max(stats.max_ms, elapsed_ms)
+
+
+async def flush():
+    """Adds the shapes recorded since the last flush to the ones stored in the database."""
+    if not _shapes:
+        return
+    shapes = list(_shapes.values())
+    _shapes.clear()
+    await client.beacon.get_collection(conf.index_advisor_collection).bulk_write([
+        UpdateOne(
+            {"_id": "{}|{}".format(stats.collection, stats.shape)},
+            {
+                "$set": {"collection": stats.collection, "shape": stats.shape, "sample": stats.sample},
+                "$inc": {"count": stats.count, "totalMs": stats.total_ms},
+                "$max": {"maxMs": stats.max_ms},
+                "$currentDate": {"lastSeen": True},
+            },
+            upsert=True
+        )
+        for stats in shapes
+    ], ordered=False)
+    LOG.debug("Index advisor: {} query shapes flushed".format(len(shapes)))
+
+
+async def run():
+    """Flushes the recorded shapes periodically, until cancelled."""
+    interval = conf.index_advisor_flush_seconds
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            await flush()
+    finally:
+        await flush()
+
+
+def index_candidates(shape: Any, prefix: str = '') -> List[List[Tuple[str, int]]]:
+    """Compound index keys able to serve a query shape: one for the query, and one per $or clause."""
+    equality, ranges, candidates = [], [], []
+    _collect_predicates(shape, prefix, equality, ranges, candidates)
+    keys = sorted(set(equality)) + [f for f in sorted(set(ranges)) if f not in equality]
+    if keys:
+        candidates.insert(0, [(f, ASCENDING) for f in keys[:MAX_INDEX_FIELDS]])
+    return candidates
+
+
+def _collect_predicates(shape: dict, prefix: str, equality: List[str], ranges: List[str], candidates: list):
+    for key, value in shape.items():
+        if key == '$and':
+            for clause in value:
+                _collect_predicates(clause, prefix, equality, ranges, candidates)
+        elif key == '$or':
+            # Each clause of a $or needs its own index for the query to use any of them
+            for clause in value:
+                candidates.extend(index_candidates(clause, prefix))
+        elif key.startswith('$'):
+            # $text is served by the text index, $nor/$not/$nin/$ne can't use an index efficiently
+            continue
+        elif isinstance(value, dict):
+            operators = set(value)
+            if '$elemMatch' in operators:
+                _collect_predicates(value['$elemMatch'], prefix + key + '.', equality, ranges, candidates)
+            elif operators & EQUALITY_OPERATORS:
+                equality.append(prefix + key)
+            elif operators & RANGE_OPERATORS:
+                ranges.append(prefix + key)
+            elif not any(op.startswith('$') for op in operators):
+                # Embedded document matched as a whole
+                equality.append(prefix + key)
+        else:
+            equality.append(prefix + key)
+
+
+def is_covered(keys: List[Tuple[str, int]], indexes: List[List[Tuple[str, int]]]) -> bool:
+    fields = [k for k, _ in keys]
+    return any([k for k, _ in index[:len(fields)]] == fields for index in indexes)
+
+
+async def load_shapes() -> List[ShapeStats]:
+    shapes = [s for s in _shapes.values()]
+    async for doc in client.beacon.get_collection(conf.index_advisor_collection).find():
+        shapes.append(ShapeStats(doc["collection"], doc["shape"], doc["sample"],
+                                 doc["count"], doc["totalMs"], doc["maxMs"]))
+    return shapes
+
+
+async def propose_indexes(min_count: int = 1, top: int = 10) -> List[IndexProposal]:
+    proposals: Dict[Tuple[str, tuple], IndexProposal] = {}
+    for stats in await load_shapes():
+        if stats.count < min_count:
+            continue
+        for keys in index_candidates(json.loads(stats.shape)):
+            proposal = proposals.get((stats.collection, tuple(keys)))
+            if proposal is None:
+                proposal = proposals[(stats.collection, tuple(keys))] = IndexProposal(stats.collection, keys)
+            proposal.count += stats.count
+            proposal.total_ms += stats.total_ms
+            proposal.shapes.append(stats.shape)
+            # The hottest query is the one used to explain the plan change
+            if proposal.sample is None or stats.total_ms > proposal.sample_ms:
+                proposal.sample, proposal.sample_ms = stats.sample, stats.total_ms
+
+    existing = {}
+    for collection in {p.collection for p in proposals.values()}:
+        information = await client.beacon.get_collection(collection).index_information()
+        existing[collection] = [index["key"] for index in information.values()]
+
+    ranked = sorted(
+        (p for p in proposals.values() if not is_covered(p.keys, existing[p.collection])),
+        key=lambda p: p.total_ms,
+        reverse=True
+    )
+    return ranked[:top]
+
+
+async def explain(collection: str, query: dict) -> dict:
+    return summarize_plan(await explain_command({"find": collection, "filter": query}))
+
+
+def index_predicates(query: dict, fields: set) -> dict:
+    """Clauses of the query, out of any $or, on the fields of an index: the bounds of a scan of the index."""
+    clauses = []
+    for key, value in query.items():
+        clause_list = value if key == '$and' else [{key: value}]
+        for clause in clause_list:
+            if '$and' in clause:
+                clause = index_predicates(clause, fields)
+            equality, ranges = [], []
+            _collect_predicates(query_shape(clause), '', equality, ranges, [])
+            if fields & set(equality + ranges):
+                clauses.append(clause)
+    return {'$and': clauses} if clauses else {}
+
+
+async def estimate_plan(collection: str, query: dict, keys: List[Tuple[str, int]]) -> dict:
+    """
+    Heuristic plan of the query with the proposed index, without creating it: the index would
+    examine the documents matching the clauses on its fields. Unknown when the fields are only
+    queried in a $or, and the planner may still prefer another index.
+    """
+    predicates = index_predicates(query, {k for k, _ in keys})
+    docs_examined = await client.beacon.get_collection(collection).count_documents(predicates) if predicates else None
+    return {
+        "plan": "FETCH <- IXSCAN",
+        "indexes": [index_name(keys)],
+        "docsExamined": docs_examined,
+        "heuristic": True,
+    }
+
+
+def index_name(keys: List[Tuple[str, int]]) -> str:
+    return "advisor_" + "_".join(k.replace('.', '_') for k, _ in keys)
+
+
+async def advise(create: bool = False, min_count: int = 1, top: int = 10) -> List[dict]:
+    report = []
+    for proposal in await propose_indexes(min_count, top):
+        query = json_util.loads(proposal.sample)
+        entry = {
+            "collection": proposal.collection,
+            "index": proposal.keys,
+            "queries": proposal.count,
+            "totalMs": round(proposal.total_ms),
+            "shapes": len(proposal.shapes),
+            "before": await explain(proposal.collection, query),
+        }
+        if create:
+            start = time.monotonic()
+            await client.beacon.get_collection(proposal.collection).create_index(
+                proposal.keys, name=index_name(proposal.keys))
+            LOG.info("Created index {} on {} in {:.1f}s".format(
+                index_name(proposal.keys), proposal.collection, time.monotonic() - start))
+            entry["after"] = await explain(proposal.collection, query)
+        else:
+            entry["after"] = await estimate_plan(proposal.collection, query, proposal.keys)
+        report.append(entry)
+    return report
+
+
+def log_report(report: List[dict]):
+    if not report:
+        LOG.info("No index to propose")
+    for entry in report:
+        before, after = entry["before"], entry["after"]
+        LOG.info("{}: {} ({} queries, {} shapes, {} ms in total)".format(
+            entry["collection"], dict(entry["index"]), entry["queries"], entry["shapes"], entry["totalMs"]))
+        LOG.info("    before: {} {}, {} docs examined for {} returned".format(
+            before["plan"], before["indexes"], before["docsExamined"], before["returned"]))
+        if after.get("heuristic"):
+            # The index is not created on a dry run, so the planner can't be asked
+            LOG.info("    after (estimate, the index is not created): {} {}, {} docs examined".format(
+                after["plan"], after["indexes"],
+                "unknown" if after["docsExamined"] is None else "about {}".format(after["docsExamined"])))
+        else:
+            LOG.info("    after: {} {}, {} docs examined for {} returned".format(
+                after["plan"], after["indexes"], after["docsExamined"], after["returned"]))
+
+
+def main():
+    parser = argparse.ArgumentParser("Beacon index advisor")
+    parser.add_argument("--create", action="store_true", help="Create the proposed indexes (dry run by default)")
+    parser.add_argument("--min-count", type=int, default=1, help="Ignore the query shapes seen fewer times")
+    parser.add_argument("--top", type=int, default=10, help="Maximum number of indexes to propose")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON instead of logging it")
+    args = parser.parse_args()
+    load_logger()
+    report = asyncio.run(advise(args.create, args.min_count, args.top))
+    if args.json:
+        print(json_util.dumps(report, indent=2))
+    else:
+        log_report(report)
+
+
+if __name__ == "__main__":
+    main()
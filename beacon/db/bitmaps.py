@@ -0,0 +1,123 @@
+"""
+Bitmap engine.
+
+Evaluates the filters of a request as operations on bitmaps of documents, interned as
+by the ontology index: every filter is resolved once into the bitmap of the documents
+matching it (from the ontology index, or from the ``_id`` of the documents matched by
+its compiled predicate), cached per collection and filter, and the filters of a request
+are intersected. The count and boolean responses are answered with the cardinality of
+the result, so changing one filter of a request only evaluates that filter.
+"""
+
+from collections import OrderedDict
+from typing import Optional
+
+from pymongo.errors import ExecutionTimeout
+from pyroaring import BitMap
+
+from beacon import conf
+from beacon.db import budget, catalog, client, deferred, explain, ontology_index, with_collection_options
+from beacon.db.filters import compile_filter, get_scope, is_ontology_filter
+from beacon.db.plans import canonical_key
+from beacon.db.utils import chunked_queries, requested_ids
+from beacon.request.model import Granularity, Operator, OntologyFilter, RequestParams
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+_cache: 'OrderedDict[str, BitMap]' = OrderedDict()
+
+
+def is_enabled() -> bool:
+    return conf.bitmap_engine_enabled
+
+
+def clear():
+    _cache.clear()
+
+
+async def get_filter_bitmap(collection: str, filter: dict) -> Optional[BitMap]:
+    """Documents matching a filter, or None if it can't be evaluated."""
+    collection_name = catalog.collection_name(collection)
+    index = ontology_index.get_index(collection_name)
+    if index is None:
+        return None
+
+    if is_ontology_filter(filter) and get_scope(filter, collection) is None:
+        bitmap = ontology_index.get_bitmap(collection_name, OntologyFilter(**filter))
+        if bitmap is not None:
+            return bitmap
+
+    if "value" in filter:
+        # Same key with and without the default operator
+        filter = {"operator": Operator.EQUAL, **filter}
+    field = catalog.resolve(collection, filter["id"]) if "value" in filter and get_scope(filter, collection) is None else None
+    if field is not None and not field.is_ontology_term and filter.get("operator") == Operator.NOT:
+        # The negation of a filter on a single field is the complement of the filter,
+        # which shares its bitmap with the positive filter
+        bitmap = await get_filter_bitmap(collection, {**filter, "operator": Operator.EQUAL})
+        return index.complement(bitmap) if bitmap is not None else None
+
+    # The documents inserted since the last refresh of the index are not part of the bitmaps
+    key = canonical_key(collection, filter, conf.update_datetime, len(index.object_ids))
+    bitmap = _cache.get(key)
+    if bitmap is not None:
+        _cache.move_to_end(key)
+        return bitmap
+
+    predicate, semijoin = await deferred.resolve_semijoin(compile_filter(filter, collection),
+                                                          conf.semijoin_chunk_size)
+    bitmap = BitMap()
+    if semijoin is None and list(predicate) == ["_id"] and list(predicate["_id"]) == ["$in"]:
+        # Already resolved by an in-memory index (e.g. the measures), there is nothing to query
+        bitmap.update(index.integer_ids[i] for i in predicate["_id"]["$in"] if i in index.integer_ids)
+    else:
+        # A long semi-join is queried a chunk of values at a time, the bitmap merges them
+        predicates = [predicate] if semijoin is None else chunked_queries(predicate, *semijoin)
+        mongo_collection = client.beacon.get_collection(collection_name)
+        for chunk_predicate in predicates:
+            explain.record(mongo_collection, "find", filter=chunk_predicate, projection={"_id": 1})
+            cursor = with_collection_options(mongo_collection).find(chunk_predicate, {"_id": 1}) \
+                .max_time_ms(budget.remaining_ms())
+            try:
+                async for document in cursor:
+                    i = index.integer_ids.get(document["_id"])
+                    if i is not None:
+                        bitmap.add(i)
+            except ExecutionTimeout:
+                return None
+    bitmap.run_optimize()
+    LOG.debug("Bitmap engine: {} documents of {} match {}".format(len(bitmap), collection_name, filter))
+
+    _cache[key] = bitmap
+    while len(_cache) > conf.bitmap_cache_size:
+        _cache.popitem(last=False)
+    return bitmap
+
+
+async def count_filters(collection: str, entry_id: Optional[str], qparams: RequestParams) -> Optional[int]:
+    """
+    Number of documents matching the filters of a count or boolean request made only of filters,
+    or None if the request has to be answered with a query.
+    """
+    if not is_enabled() or not qparams.query.filters:
+        return None
+    if qparams.returned_granularity() == Granularity.RECORD:
+        return None
+    if qparams.query.request_parameters or requested_ids(entry_id, qparams):
+        return None
+
+    result = None
+    for filter in qparams.query.filters:
+        bitmap = await get_filter_bitmap(collection, filter)
+        if bitmap is None:
+            return None
+        result = bitmap if result is None else result & bitmap
+        if not result:
+            break
+
+    LOG.debug("Bitmap engine: {} documents of {} match the filters".format(len(result), collection))
+    if qparams.returned_granularity() == Granularity.BOOLEAN:
+        return int(len(result) > 0)
+    return len(result)
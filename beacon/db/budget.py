@@ -0,0 +1,73 @@
+"""
+Query time budgets.
+
+Each request gets a deadline from the budget of its route and granularity, and every
+query sent to MongoDB on its behalf is given the time left as ``maxTimeMS``.
+When the budget runs out the queries give up, keep what they already have and mark
+the response as partial (206).
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from beacon import conf
+from beacon.request.model import Granularity
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+# Used for the queries run outside a request (e.g. at startup)
+DEFAULT_BUDGET_MS = 10 * 1000
+
+
+class QueryBudget:
+
+    def __init__(self, budget_ms: int):
+        self.budget_ms = budget_ms
+        self.deadline = time.monotonic() + budget_ms / 1000
+        # Set when a query ran out of time, the concurrent queries of a request share it
+        self.partial = False
+
+    def remaining_ms(self) -> int:
+        # maxTimeMS=0 means no limit, so at least 1 ms is always given
+        return max(1, int((self.deadline - time.monotonic()) * 1000))
+
+
+_budget: ContextVar[Optional[QueryBudget]] = ContextVar('query_budget', default=None)
+
+
+def get_budget_ms(route: Optional[str], granularity: Granularity) -> int:
+    budgets = conf.query_time_budget_ms
+    route_budgets = conf.query_time_budget_routes.get(route, {})
+    return route_budgets.get(granularity.value, budgets.get(granularity.value, DEFAULT_BUDGET_MS))
+
+
+def start(route: Optional[str], granularity: Granularity) -> QueryBudget:
+    budget = QueryBudget(get_budget_ms(route, granularity))
+    _budget.set(budget)
+    LOG.debug("Query time budget for {} ({}): {} ms".format(route, granularity.value, budget.budget_ms))
+    return budget
+
+
+def remaining_ms() -> int:
+    budget = _budget.get()
+    return budget.remaining_ms() if budget is not None else DEFAULT_BUDGET_MS
+
+
+def grace_ms() -> int:
+    """Time given to the cheap fallback queries once the budget has run out."""
+    return conf.query_time_budget_grace_ms
+
+
+def mark_partial(reason: str):
+    budget = _budget.get()
+    LOG.warning("Query time budget exhausted: {}".format(reason))
+    if budget is not None:
+        budget.partial = True
+
+
+def is_partial() -> bool:
+    budget = _budget.get()
+    return budget is not None and budget.partial
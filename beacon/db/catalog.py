@@ -0,0 +1,89 @@
+"""
+Field catalog.
+
+Maps the id of each filtering term to the document paths it is found at and the type
+of its values, per collection, as written in the ``filtering_terms`` collection by
+``deploy/extract_filtering_terms.py``. It is loaded when the beacon starts, so the
+alphanumeric filters on a known term compile to a single predicate on its path
+instead of an ``$or`` over every field of the collection. The terms found at several
+paths are only looked up with ``paths()``.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+from beacon.db import client, plans
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+# Name of the collection queried by each entity module, when it differs
+COLLECTIONS = {
+    'g_variants': 'genomicVariations',
+}
+
+
+@dataclass(frozen=True)
+class CatalogField:
+    path: str
+    value_type: str
+    # Alphanumeric terms are the fields themselves, ontology terms are values found at a path
+    is_ontology_term: bool = False
+
+
+_fields: Dict[Tuple[str, str], CatalogField] = {}
+_paths: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+
+
+def collection_name(collection: str) -> str:
+    return COLLECTIONS.get(collection, collection)
+
+
+def resolve(collection: Optional[str], term_id: str) -> Optional[CatalogField]:
+    """Returns where a filtering term is found in a collection, or None if it is not in the catalog."""
+    if collection is None:
+        return None
+    return _fields.get((collection_name(collection), term_id))
+
+
+def paths(collection: Optional[str], term_id: str) -> Tuple[str, ...]:
+    """Every path a filtering term is found at in a collection, none if it is not in the catalog."""
+    if collection is None:
+        return ()
+    return _paths.get((collection_name(collection), term_id), ())
+
+
+def merge_value_types(value_types: Set[str]) -> str:
+    return next(iter(value_types)) if len(value_types) == 1 else 'mixed'
+
+
+async def load():
+    term_paths: Dict[Tuple[str, str], Dict[str, None]] = {}
+    value_types: Dict[Tuple[str, str], Set[str]] = {}
+    ontology_terms = set()
+    projection = {"_id": 0, "id": 1, "collection": 1, "path": 1, "paths": 1, "valueType": 1, "type": 1}
+    query = {"$or": [{"path": {"$exists": True}}, {"paths": {"$exists": True}}]}
+    async for term in client.beacon.filtering_terms.find(query, projection):
+        key = (term["collection"], term["id"])
+        # A term can be listed once with all its paths, or once per path
+        term_paths.setdefault(key, {}).update(dict.fromkeys(term.get("paths") or [term["path"]]))
+        value_types.setdefault(key, set()).add(term.get("valueType", "string"))
+        if term.get("type") != "alphanumeric":
+            ontology_terms.add(key)
+
+    fields = {}
+    for key, key_paths in term_paths.items():
+        if len(key_paths) > 1:
+            # Found at several paths, it can't be compiled to a single predicate
+            LOG.debug("Field catalog: {} is found at several paths of {}".format(key[1], key[0]))
+            continue
+        fields[key] = CatalogField(next(iter(key_paths)), merge_value_types(value_types[key]), key in ontology_terms)
+
+    _fields.clear()
+    _fields.update(fields)
+    _paths.clear()
+    _paths.update({key: tuple(key_paths) for key, key_paths in term_paths.items()})
+    # The queries compiled before the catalog was loaded can't be reused
+    plans.cache.clear()
+    LOG.info("Field catalog loaded: {} terms".format(len(_fields)))
@@ -0,0 +1,153 @@
+"""
+Deferred clauses.
+
+Some filters can only be compiled to a query by running another query first, which
+the filter compiler doesn't do so the compiled queries can be cached. They are
+compiled to placeholders instead, replaced before the query is run:
+
+- ``$semijoin``: a filter scoped to another entity than the queried one (e.g. a biosample
+  filter on the individuals endpoint) is replaced by the values of the related field of
+  the documents of the other entity matching the filter, e.g.
+  ``{"id": {"$in": <individualId of the matching biosamples>}}``. With
+  ``resolve_semijoin()``, a semi-join on too many values is returned apart from the
+  query instead, to be queried a chunk of values at a time.
+- ``$complement``: a negated filter on a field of the catalog is replaced by the complement
+  of the positive filter, which can use the index of the field: ``{"_id": {"$nin": <_id of the matching documents>}}``, or the
+  difference with the ``_id`` candidates of the same ``$and``. When too many documents
+  match the positive filter, the negated predicate is used as it is.
+"""
+
+from typing import Any, List, Optional, Tuple
+
+from pymongo.errors import ExecutionTimeout
+
+from beacon import conf
+from beacon.db import budget, client, explain, with_collection_options
+from beacon.db.filters import COMPLEMENT, SEMIJOIN, apply_filters
+from beacon.db.relationships import get_field_values
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+def has_placeholders(value: Any) -> bool:
+    if isinstance(value, dict):
+        return SEMIJOIN in value or COMPLEMENT in value or any(has_placeholders(v) for v in value.values())
+    elif isinstance(value, list):
+        return any(has_placeholders(v) for v in value)
+    return False
+
+
+async def resolve(query: Any) -> Any:
+    """Returns the query (or pipeline) with its placeholders replaced by the clauses they stand for."""
+    if not has_placeholders(query):
+        return query
+    return await _resolve(query)
+
+
+async def _resolve(value: Any) -> Any:
+    if isinstance(value, dict):
+        if SEMIJOIN in value:
+            return await _semijoin(value[SEMIJOIN])
+        if COMPLEMENT in value:
+            return await _complement(value[COMPLEMENT])
+        resolved = {k: await _resolve(v) for k, v in value.items()}
+        if "$and" in resolved:
+            resolved["$and"] = _subtract_excluded(resolved["$and"])
+        return resolved
+    elif isinstance(value, list):
+        return [await _resolve(v) for v in value]
+    return value
+
+
+async def resolve_semijoin(query: Any, max_values: int) -> Tuple[Any, Optional[Tuple[str, List[Any]]]]:
+    """
+    Resolves the placeholders of a query, except the first semi-join of its top level $and
+    on more than max_values values, returned apart as its field and values.
+    """
+    found = []
+    query = await _extract_semijoin(query, max_values, found)
+    return await resolve(query), found[0] if found else None
+
+
+async def _extract_semijoin(query: Any, max_values: int, found: list) -> Any:
+    # Only the clauses of the top level $and (and of the $and nested in it) restrict the whole query
+    if not isinstance(query, dict) or not has_placeholders(query.get("$and")):
+        return query
+    clauses = []
+    for clause in query["$and"]:
+        if isinstance(clause, dict) and SEMIJOIN in clause:
+            field, values = await _semijoin_values(clause[SEMIJOIN])
+            if not found and len(values) > max_values:
+                found.append((field, values))
+                continue
+            clause = {field: {"$in": values}}
+        else:
+            clause = await _extract_semijoin(clause, max_values, found)
+        clauses.append(clause)
+    query = {k: v for k, v in query.items() if k != "$and"}
+    if clauses:
+        query["$and"] = clauses
+    return query
+
+
+async def _semijoin(semijoin: dict) -> dict:
+    field, values = await _semijoin_values(semijoin)
+    return {field: {"$in": values}}
+
+
+async def _semijoin_values(semijoin: dict) -> Tuple[str, List[Any]]:
+    collection = client.beacon.get_collection(semijoin["from"])
+    field = semijoin["foreignField"]
+    # The filter of the other entity may be negated too
+    query = await resolve(apply_filters({}, [semijoin["filter"]], semijoin["scope"]))
+    projection = {field: 1, "_id": 0}
+    explain.record(collection, "find", filter=query, projection=projection)
+    cursor = with_collection_options(collection).find(query, projection).batch_size(conf.semijoin_chunk_size)
+    cursor = cursor.max_time_ms(budget.remaining_ms())
+    values = set()
+    try:
+        async for document in cursor:
+            values.update(get_field_values(document, field))
+    except ExecutionTimeout:
+        budget.mark_partial("semi-join on {}".format(collection.name))
+    LOG.debug("Semi-join: {} values of {}.{} match {}".format(len(values), collection.name, field, semijoin["filter"]))
+    return semijoin["localField"], sorted(values, key=str)
+
+
+async def _complement(complement: dict) -> dict:
+    collection = client.beacon.get_collection(complement["from"])
+    max_ids = conf.negation_complement_max_ids
+    positive = complement["positive"]
+    explain.record(collection, "find", filter=positive, projection={"_id": 1}, limit=max_ids + 1)
+    cursor = with_collection_options(collection).find(positive, {"_id": 1}).limit(max_ids + 1)
+    try:
+        object_ids = [document["_id"] async for document in cursor.max_time_ms(budget.remaining_ms())]
+    except ExecutionTimeout:
+        return complement["negated"]
+    if len(object_ids) > max_ids:
+        LOG.debug("Complement: more than {} documents of {} match {}".format(max_ids, collection.name, positive))
+        return complement["negated"]
+    LOG.debug("Complement: {} documents of {} excluded".format(len(object_ids), collection.name))
+    return {"_id": {"$nin": object_ids}}
+
+
+def _is_id_clause(clause: Any, operator: str) -> bool:
+    return isinstance(clause, dict) and list(clause) == ["_id"] and isinstance(clause["_id"], dict) \
+        and list(clause["_id"]) == [operator]
+
+
+def _subtract_excluded(clauses: List[Any]) -> List[Any]:
+    # The documents excluded by the complements are removed from the candidates, if there are any
+    candidates = next((clause for clause in clauses if _is_id_clause(clause, "$in")), None)
+    excluded = [clause for clause in clauses if _is_id_clause(clause, "$nin")]
+    if candidates is None or not excluded:
+        return clauses
+    excluded_ids = set()
+    for clause in excluded:
+        excluded_ids.update(clause["_id"]["$nin"])
+    remaining = [object_id for object_id in candidates["_id"]["$in"] if object_id not in excluded_ids]
+    excluded_clauses = {id(clause) for clause in excluded}
+    return [{"_id": {"$in": remaining}} if clause is candidates else clause
+            for clause in clauses if id(clause) not in excluded_clauses]
@@ -0,0 +1,84 @@
+"""
+Query plans.
+
+While a request is explained, every query the db functions send to MongoDB is also
+recorded as the equivalent database command (``find``, ``count`` or ``aggregate``),
+so that it can be run again through ``explain`` with ``executionStats``.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from beacon.db import client
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+_operations: ContextVar[Optional[List[dict]]] = ContextVar('explained_operations', default=None)
+
+
+@contextmanager
+def capture():
+    """Collects the commands of the queries run in this context (and the tasks it starts)."""
+    operations = []
+    token = _operations.set(operations)
+    try:
+        yield operations
+    finally:
+        _operations.reset(token)
+
+
+def record(collection: AsyncIOMotorCollection, command: str, **arguments):
+    operations = _operations.get()
+    if operations is not None:
+        operations.append({command: collection.name, **{k: v for k, v in arguments.items() if v is not None}})
+
+
+def summarize_plan(explain: dict) -> dict:
+    """Stages of the winning plan, indexes used and examined keys/documents of an explain output."""
+    if "queryPlanner" not in explain and "stages" in explain:
+        # Aggregations: the query part of the pipeline is explained in its $cursor stage
+        explain = explain["stages"][0].get("$cursor", {})
+    if "queryPlanner" not in explain:
+        return {"plan": None, "indexes": [], "returned": None, "keysExamined": None, "docsExamined": None, "ms": None}
+    stages, indexes = [], []
+    plan = explain["queryPlanner"]["winningPlan"]
+    plan = plan.get("queryPlan", plan)
+    pending = [plan]
+    while pending:
+        stage = pending.pop()
+        stages.append(stage["stage"])
+        if "indexName" in stage:
+            indexes.append(stage["indexName"])
+        pending.extend(stage.get("inputStages", []))
+        if "inputStage" in stage:
+            pending.append(stage["inputStage"])
+    stats = explain.get("executionStats", {})
+    return {
+        "plan": " <- ".join(stages),
+        "indexes": indexes,
+        "returned": stats.get("nReturned"),
+        "keysExamined": stats.get("totalKeysExamined"),
+        "docsExamined": stats.get("totalDocsExamined"),
+        "ms": stats.get("executionTimeMillis"),
+    }
+
+
+async def explain(command: dict) -> dict:
+    return await client.beacon.command({"explain": command, "verbosity": "executionStats"})
+
+
+async def explain_operations(operations: List[dict]) -> List[dict]:
+    report = []
+    for command in operations:
+        output = await explain(command)
+        report.append({
+            "command": command,
+            **summarize_plan(output),
+            "explain": output,
+        })
+    return report
@@ -1,9 +1,14 @@
 from collections import defaultdict
-from typing import List, Union
+from typing import List, Optional, Tuple, Union
 import re
 import dataclasses
 from copy import deepcopy
 
+from beacon import conf
+from beacon.db import catalog, measures, ontology_index, trigrams
+from beacon.db.catalog import CatalogField
+from beacon.db.plans import cached_plan
+from beacon.db.relationships import get_relationship
 from beacon.request import ontologies
 from beacon.request.model import AlphanumericFilter, CustomFilter, OntologyFilter, Operator, Similarity
 #from beacon.semantic_similarity import semantic_similarity
@@ -21,63 +26,188 @@ G_VARIANTS_MAP = ['_info.vcf2bff.hostname', '_info.vcf2bff.filein', '_info.vcf2b
 RUNS_MAP = ['biosampleId','id','individualId','libraryLayout','librarySelection','librarySource.id','librarySource.label','libraryStrategy','platform','platformModel.id','platformModel.label','runDate']
 
 
+# Entity collections (as named by the db modules) the filters can be scoped to
+SCOPES = {
+    'analyses': 'analyses',
+    'analysis': 'analyses',
+    'biosample': 'biosamples',
+    'biosamples': 'biosamples',
+    'g_variants': 'g_variants',
+    'genomicVariation': 'g_variants',
+    'genomicVariations': 'g_variants',
+    'individual': 'individuals',
+    'individuals': 'individuals',
+    'run': 'runs',
+    'runs': 'runs',
+}
+
+# Placeholders of the filters scoped to another entity and of the negated filters,
+# resolved by beacon.db.deferred
+SEMIJOIN = '$semijoin'
+COMPLEMENT = '$complement'
+
+COLLECTION_MAPS = {
+    'analyses': ANALYSES_MAP,
+    'biosamples': BIOSAMPLES_MAP,
+    'g_variants': G_VARIANTS_MAP,
+    'individuals': INDIVIDUALS_MAP,
+    'runs': RUNS_MAP,
+}
+
+
+@cached_plan(lambda query, filters, collection: (collection, query, filters))
 def apply_filters(query: dict, filters: List[dict], collection: str) -> dict:
     LOG.debug("Filters len = {}".format(len(filters)))
     if len(filters) > 0:
-        query["$and"] = []
-    if len(filters) == 1:
-        for filter in filters:
-            partial_query = {}
-            if "value" in filter:
-                LOG.debug(filter)
-                filter = AlphanumericFilter(**filter)
-                LOG.debug("Alphanumeric filter: %s %s %s", filter.id, filter.operator, filter.value)
-                partial_query = apply_alphanumeric_filter(partial_query, filter, collection)
-            elif "similarity" in filter or "includeDescendantTerms" in filter or re.match(CURIE_REGEX, filter["id"]):
-                filter = OntologyFilter(**filter)
-                LOG.debug("Ontology filter: %s", filter.id)
-                partial_query = {"$text": defaultdict(str) }
-                #partial_query =  { "$text": { "$search": "" } } 
-                LOG.debug(partial_query)
-                partial_query = apply_ontology_filter(partial_query, filter)
-            else:
-                filter = CustomFilter(**filter)
-                LOG.debug("Custom filter: %s", filter.id)
-                partial_query = apply_custom_filter(partial_query, filter)
-        query["$and"].append(partial_query)
-    if len(filters) > 1:
-        list_of_filters=[]
-        for filter in filters:
-            partial_query = {}
-            if "value" in filter:
-                LOG.debug(filter)
-                filter = AlphanumericFilter(**filter)
-                LOG.debug("Alphanumeric filter: %s %s %s", filter.id, filter.operator, filter.value)
-                partial_query = apply_alphanumeric_filter(partial_query, filter)
-            elif "similarity" in filter or "includeDescendantTerms" in filter or re.match(CURIE_REGEX, filter["id"]):
-                filter = OntologyFilter(**filter)
-                LOG.debug("Ontology filter: %s", filter.id)
-                partial_query = {"$text": defaultdict(str) }
-                #partial_query =  { "$text": { "$search": "" } } 
-                LOG.debug(partial_query)
-                partial_query = apply_ontology_filter(partial_query, filter)
-            else:
-                filter = CustomFilter(**filter)
-                LOG.debug("Custom filter: %s", filter.id)
-                partial_query = apply_custom_filter(partial_query, filter)
-            list_of_filters.append(partial_query['$text']['$search'])
+        # The clauses already in the query (entry id, request parameters) are kept
+        query.setdefault("$and", [])
+    filters, documents = apply_indexed_ontology_filters(filters, collection)
+    if documents is not None:
+        query["$and"].append(documents)
+    text_searches = []
+    for filter in filters:
+        partial_query = compile_filter(filter, collection)
+        if "$text" in partial_query:
+            text_searches.append(partial_query)
+        else:
+            query["$and"].append(partial_query)
+    if len(text_searches) == 1:
+        query["$and"].append(text_searches[0])
+    elif len(text_searches) > 1:
+        # A query can only have one $text, the searches are joined as phrases
         string = ''
-        for filt in list_of_filters:
-            string += f'"{filt}"' + ' '
-        dict_search={}
-        dict_search['$search']=string
-        dict_text={}
-        dict_text['$text']=dict_search
-        query["$and"].append(dict_text)
+        for text_search in text_searches:
+            string += f'"{text_search["$text"]["$search"]}"' + ' '
+        query["$and"].append({"$text": {"$search": string}})
+    if len(query.get("$and", [])) > 1:
+        query["$and"] = restructure_clauses(query["$and"])
 
     return query
 
 
+def restructure_clauses(clauses: List[dict]) -> List[dict]:
+    """
+    Flattens the nested $and and intersects the lists of documents found by the in-memory
+    indexes into one.
+    """
+    flat_clauses, documents = [], None
+    for clause in clauses:
+        if list(clause) == ["$and"]:
+            flat_clauses.extend(restructure_clauses(clause["$and"]))
+        elif list(clause) == ["_id"] and isinstance(clause["_id"], dict) and list(clause["_id"]) == ["$in"]:
+            if documents is None:
+                documents = clause["_id"]["$in"]
+            else:
+                found = set(clause["_id"]["$in"])
+                documents = tuple(document for document in documents if document in found)
+        else:
+            flat_clauses.append(clause)
+    if documents is not None:
+        flat_clauses.append({"_id": {"$in": documents}})
+    return flat_clauses
+
+
+def is_ontology_filter(filter: dict) -> bool:
+    return "value" not in filter and (
+        "similarity" in filter or "includeDescendantTerms" in filter or bool(re.match(CURIE_REGEX, filter["id"])))
+
+
+def get_scope(filter: dict, collection: str) -> Optional[str]:
+    """Entity a filter is scoped to, if it is not the queried one."""
+    scope = SCOPES.get(filter.get("scope"))
+    return scope if scope is not None and collection is not None and scope != collection else None
+
+
+def apply_scoped_filter(filter: dict, scope: str, collection: str) -> Optional[dict]:
+    try:
+        local_field, foreign_field = get_relationship(catalog.collection_name(collection), catalog.collection_name(scope))
+    except KeyError:
+        LOG.debug("No relationship between {} and {}, the filter is applied to {}".format(collection, scope, collection))
+        return None
+    return {SEMIJOIN: {
+        "scope": scope,
+        "from": catalog.collection_name(scope),
+        "filter": {k: v for k, v in filter.items() if k != "scope"},
+        "localField": local_field,
+        "foreignField": foreign_field,
+    }}
+
+
+def apply_scoped_ontology_filter(filter: OntologyFilter, collection: str) -> Optional[dict]:
+    """
+    Predicate on the paths of the queried entity the terms of an ontology filter (and their
+    descendants) are found at, or None if the field catalog doesn't know any of them.
+    """
+    terms = ontology_index.filter_terms(filter)
+    if not terms:
+        return None
+    paths = {}
+    for term in terms:
+        for path in catalog.paths(collection, term):
+            paths.setdefault(path, []).append(term)
+    clauses = [{path: path_terms[0] if len(path_terms) == 1 else {"$in": path_terms}}
+               for path, path_terms in paths.items()]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def apply_indexed_ontology_filters(filters: List[dict], collection: str) -> Tuple[List[dict], Optional[dict]]:
+    """
+    Evaluates the ontology filters that can be with the ontology index, as the intersection
+    of the documents matching each of them. Returns the filters left to compile, and the
+    predicate on the documents matching the evaluated ones.
+    """
+    collection_name = catalog.collection_name(collection) if collection is not None else None
+    index = ontology_index.get_index(collection_name)
+    if index is None:
+        return filters, None
+    remaining, bitmap = [], None
+    for filter in filters:
+        filter_bitmap = None
+        if is_ontology_filter(filter) and get_scope(filter, collection) is None:
+            filter_bitmap = ontology_index.get_bitmap(collection_name, OntologyFilter(**filter))
+        if filter_bitmap is None:
+            remaining.append(filter)
+        else:
+            bitmap = filter_bitmap if bitmap is None else bitmap & filter_bitmap
+    if bitmap is None or len(bitmap) > conf.ontology_index_max_ids:
+        # Too many documents for an $in, the $text search is used instead
+        return filters, None
+    LOG.debug("Ontology index: {} documents match the ontology filters".format(len(bitmap)))
+    return remaining, {"_id": {"$in": tuple(index.get_object_ids(bitmap))}}
+
+
+def compile_filter(filter: dict, collection: str) -> dict:
+    partial_query = {}
+    scope = get_scope(filter, collection)
+    if scope is not None:
+        scoped_query = apply_scoped_filter(filter, scope, collection)
+        if scoped_query is not None:
+            return scoped_query
+    if "value" in filter:
+        LOG.debug(filter)
+        filter = AlphanumericFilter(**filter)
+        LOG.debug("Alphanumeric filter: %s %s %s", filter.id, filter.operator, filter.value)
+        partial_query = apply_alphanumeric_filter(partial_query, filter, collection)
+    elif is_ontology_filter(filter):
+        filter = OntologyFilter(**filter)
+        LOG.debug("Ontology filter: %s", filter.id)
+        if SCOPES.get(filter.scope) == collection:
+            scoped_query = apply_scoped_ontology_filter(filter, collection)
+            if scoped_query is not None:
+                return scoped_query
+        partial_query = {"$text": defaultdict(str) }
+        #partial_query =  { "$text": { "$search": "" } } 
+        LOG.debug(partial_query)
+        partial_query = apply_ontology_filter(partial_query, filter)
+    else:
+        filter = CustomFilter(**filter)
+        LOG.debug("Custom filter: %s", filter.id)
+        partial_query = apply_custom_filter(partial_query, filter)
+    return partial_query
+
+
 def apply_ontology_filter(query: dict, filter: OntologyFilter) -> dict:
     
     is_filter_id_required = True
@@ -143,290 +273,115 @@ def format_operator(operator: Operator) -> str:
         # operator == Operator.LESS_EQUAL
         return "$lte"
 
+def like_to_regex(value: str) -> str:
+    """Translates a LIKE pattern, where '%' stands for any characters, to an anchored regex."""
+    regex = '^' + '.*'.join(re.escape(part) for part in value.split('%')) + '$'
+    # Unanchored ends are dropped, an anchored prefix can be served by an index
+    if regex.startswith('^.*'):
+        regex = regex[3:]
+    if regex.endswith('.*$'):
+        regex = regex[:-3]
+    return regex
+
+
+def format_field_value(field: CatalogField, value: str) -> Union[str, int, float]:
+    if field.value_type in ('number', 'mixed'):
+        try:
+            return int(value) if value.lstrip('-').isdigit() else float(value)
+        except ValueError:
+            return value
+    return value
+
+
 def apply_alphanumeric_filter(query: dict, filter: AlphanumericFilter, collection: str) -> dict:
     LOG.debug(filter.value)
     formatted_value = format_value(filter.value)
     formatted_operator = format_operator(filter.operator)
+    field = catalog.resolve(collection, filter.id)
     if collection == 'g_variants':
-        formatted_value = format_value(filter.value)
-        formatted_operator = format_operator(filter.operator)
         query[filter.id] = { formatted_operator: formatted_value }
+    elif field is not None and not field.is_ontology_term and formatted_operator == "$ne":
+        # The positive filter can use the index of the field (or the trigrams), the negation can't
+        positive = apply_alphanumeric_filter({}, filter.copy(update={"operator": Operator.EQUAL}), collection)
+        query = apply_complement(positive, {field.path: apply_field_predicate(field, filter, "$ne")}, collection)
+    elif field is not None and not field.is_ontology_term:
+        query[field.path] = apply_field_predicate(field, filter, formatted_operator)
+        if formatted_operator == "$eq" and isinstance(filter.value, str) and '%' in filter.value:
+            # The regex is only evaluated on the documents having the trigrams of the pattern
+            candidates = trigrams.get_candidates(catalog.collection_name(collection), field.path, filter.value)
+            if candidates is not None:
+                query["_id"] = {"$in": tuple(candidates)}
     elif isinstance(formatted_value,str):
-        if formatted_operator == "$eq":
-            if '%' in filter.value:
-                if collection == 'individuals':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    value_splitted=filter.value.split('%')
-                    regex_dict={}
-                    regex_dict['$regex']=value_splitted[1]
-                    for item in INDIVIDUALS_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=regex_dict
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-                elif collection == 'analyses':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    value_splitted=filter.value.split('%')
-                    regex_dict={}
-                    regex_dict['$regex']=value_splitted[1]
-                    for item in ANALYSES_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=regex_dict
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-                elif collection == 'biosamples':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    value_splitted=filter.value.split('%')
-                    regex_dict={}
-                    regex_dict['$regex']=value_splitted[1]
-                    for item in BIOSAMPLES_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=regex_dict
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-                elif collection == 'g_variants':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    value_splitted=filter.value.split('%')
-                    regex_dict={}
-                    regex_dict['$regex']=value_splitted[1]
-                    for item in G_VARIANTS_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=regex_dict
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-                elif collection == 'runs':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    value_splitted=filter.value.split('%')
-                    regex_dict={}
-                    regex_dict['$regex']=value_splitted[1]
-                    for item in RUNS_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=regex_dict
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-            else:
-                if collection == 'individuals':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    for item in INDIVIDUALS_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=filter.value
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-                elif collection == 'analyses':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    for item in ANALYSES_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=filter.value
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-                elif collection == 'biosamples':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    for item in BIOSAMPLES_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=filter.value
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-                elif collection == 'g_variants':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    for item in G_VARIANTS_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=filter.value
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-                elif collection == 'runs':
-                    query['$and']=[]
-                    dict_text={}
-                    dict_text['$or']=[]
-                    dict_text_2={}
-                    dict_text_2['$or']=[]
-                    for item in RUNS_MAP:
-                        dict_filter={}
-                        dict_filter_2={}
-                        dict_filter_2[item]=filter.id
-                        dict_text_2['$or'].append(dict_filter_2)
-                        dict_filter[item]=filter.value
-                        dict_text['$or'].append(dict_filter)
-                    query['$and'].append(dict_text)
-                    query['$and'].append(dict_text_2)
-                    
-        elif formatted_operator == "$ne":
-            if collection == 'individuals':
-                query['$and']=[]
-                dict_text={}
-                dict_text['$or']=[]
-                dict_text_2={}
-                dict_text_2['$or']=[]
-                regex_dict={}
-                regex_dict['$regex']=filter.value
-                not_dict={}
-                not_dict['$not']=regex_dict
-                for item in INDIVIDUALS_MAP:
-                    dict_filter={}
-                    dict_filter_2={}
-                    dict_filter_2[item]=filter.id
-                    dict_text_2['$or'].append(dict_filter_2)
-                    dict_filter[item]=not_dict
-                    query['$and'].append(dict_filter)
-                query['$and'].append(dict_text_2)
-            elif collection == 'analyses':
-                query['$and']=[]
-                dict_text={}
-                dict_text['$or']=[]
-                dict_text_2={}
-                dict_text_2['$or']=[]
-                regex_dict={}
-                regex_dict['$regex']=filter.value
-                not_dict={}
-                not_dict['$not']=regex_dict
-                for item in ANALYSES_MAP:
-                    dict_filter={}
-                    dict_filter_2={}
-                    dict_filter_2[item]=filter.id
-                    dict_text_2['$or'].append(dict_filter_2)
-                    dict_filter[item]=not_dict
-                    query['$and'].append(dict_filter)
-                query['$and'].append(dict_text_2)
-            elif collection == 'biosamples':
-                query['$and']=[]
-                dict_text={}
-                dict_text['$or']=[]
-                dict_text_2={}
-                dict_text_2['$or']=[]
-                regex_dict={}
-                regex_dict['$regex']=filter.value
-                not_dict={}
-                not_dict['$not']=regex_dict
-                for item in BIOSAMPLES_MAP:
-                    dict_filter={}
-                    dict_filter_2={}
-                    dict_filter_2[item]=filter.id
-                    dict_text_2['$or'].append(dict_filter_2)
-                    dict_filter[item]=not_dict
-                    query['$and'].append(dict_filter)
-                query['$and'].append(dict_text_2)
-            elif collection == 'g_variants':
-                query['$and']=[]
-                dict_text={}
-                dict_text['$or']=[]
-                dict_text_2={}
-                dict_text_2['$or']=[]
-                regex_dict={}
-                regex_dict['$regex']=filter.value
-                not_dict={}
-                not_dict['$not']=regex_dict
-                for item in G_VARIANTS_MAP:
-                    dict_filter={}
-                    dict_filter_2={}
-                    dict_filter_2[item]=filter.id
-                    dict_text_2['$or'].append(dict_filter_2)
-                    dict_filter[item]=not_dict
-                    query['$and'].append(dict_filter)
-                query['$and'].append(dict_text_2)
-            elif collection == 'runs':
-                query['$and']=[]
-                dict_text={}
-                dict_text['$or']=[]
-                dict_text_2={}
-                dict_text_2['$or']=[]
-                regex_dict={}
-                regex_dict['$regex']=filter.value
-                not_dict={}
-                not_dict['$not']=regex_dict
-                for item in RUNS_MAP:
-                    dict_filter={}
-                    dict_filter_2={}
-                    dict_filter_2[item]=filter.id
-                    dict_text_2['$or'].append(dict_filter_2)
-                    dict_filter[item]=not_dict
-                    query['$and'].append(dict_filter)
-                query['$and'].append(dict_text_2)
+        query = apply_any_field_filter(query, filter, formatted_operator, collection)
+    elif collection == 'individuals' and measures.is_ready():
+        object_ids = measures.get_object_ids(filter.id, formatted_operator, float(formatted_value),
+                                             conf.measures_index_max_ids)
+        if object_ids is not None:
+            query = {"_id": {"$in": tuple(object_ids)}}
+        else:
+            query = apply_measures_filter(query, filter, formatted_value, formatted_operator)
     else:
-        query['measurementValue.quantity.value'] = { formatted_operator: float(formatted_value) }
-        query['assayCode.id']=filter.id
-        LOG.debug(query)
-        dict_elemmatch={}
-        dict_elemmatch['$elemMatch']=query
-        dict_measures={}
-        dict_measures['measures']=dict_elemmatch
-        query = dict_measures
-
+        query = apply_measures_filter(query, filter, formatted_value, formatted_operator)
 
     LOG.debug("QUERY: %s", query)
     return query
 
 
+def apply_measures_filter(query: dict, filter: AlphanumericFilter, formatted_value, formatted_operator: str) -> dict:
+    query['measurementValue.quantity.value'] = { formatted_operator: float(formatted_value) }
+    query['assayCode.id']=filter.id
+    LOG.debug(query)
+    dict_elemmatch={}
+    dict_elemmatch['$elemMatch']=query
+    dict_measures={}
+    dict_measures['measures']=dict_elemmatch
+    return dict_measures
+
+
+def apply_field_predicate(field: CatalogField, filter: AlphanumericFilter, formatted_operator: str) -> dict:
+    """Predicate on the path of a filtering term known to the field catalog."""
+    if isinstance(filter.value, str) and '%' in filter.value and formatted_operator in ("$eq", "$ne"):
+        regex_dict = {'$regex': like_to_regex(filter.value)}
+        return regex_dict if formatted_operator == "$eq" else {'$not': regex_dict}
+    value = filter.value if isinstance(filter.value, list) else format_field_value(field, filter.value)
+    if field.value_type == 'mixed' and value != filter.value and formatted_operator in ("$eq", "$ne"):
+        # Numbers and strings are both found at the path: the value is looked for as either
+        return { "$in" if formatted_operator == "$eq" else "$nin": [value, filter.value] }
+    return { formatted_operator: value }
+
+
+def apply_any_field_filter(query: dict, filter: AlphanumericFilter, formatted_operator: str, collection: str) -> dict:
+    """
+    Filter on a term missing from the field catalog: the id and the value are looked for
+    in every field of the collection.
+    """
+    fields = COLLECTION_MAPS.get(collection)
+    if fields is None:
+        return query
+    dict_text_2 = {'$or': [{item: filter.id} for item in fields]}
+    if formatted_operator == "$eq":
+        if '%' in filter.value:
+            value = {'$regex': like_to_regex(filter.value)}
+        else:
+            value = filter.value
+        query['$and'] = [{'$or': [{item: value} for item in fields]}, dict_text_2]
+    elif formatted_operator == "$ne":
+        # None of the fields matches the value. No index serves the regexes of the positive
+        # filter either, so its complement would scan the collection once more: negate in place
+        negated = {'$and': [{item: {'$not': {'$regex': filter.value}}} for item in fields]}
+        query['$and'] = [negated, dict_text_2]
+    return query
+
+
+def apply_complement(positive: dict, negated: dict, collection: str) -> dict:
+    """Placeholder of the documents not matching the positive predicate, or matching the negated one if too many do."""
+    return {COMPLEMENT: {
+        "from": catalog.collection_name(collection),
+        "positive": positive,
+        "negated": negated,
+    }}
+
+
 
 def apply_custom_filter(query: dict, filter: CustomFilter) -> dict:
     LOG.debug(query)
@@ -1,10 +1,12 @@
 import logging
 from typing import Dict, List, Optional
 from beacon.db.filters import apply_alphanumeric_filter, apply_filters
+from beacon.db.plans import cached_plan
 from beacon.db.schemas import DefaultSchemas
-from beacon.db.utils import query_id, query_ids, get_count, get_documents, get_cross_query, get_cross_query_variants
+from beacon.db.utils import query_id, query_ids, get_count_and_documents, get_count_and_documents_by_ids, requested_ids
+from beacon.db.joins import get_related_count_and_documents
 from beacon.request.model import AlphanumericFilter, Operator, RequestParams
-from beacon.db import client
+from beacon.db import bitmaps, client
 import json
 from bson import json_util
 
@@ -71,6 +73,7 @@ def generate_position_filter_end(key: str, value: List[int]) -> List[Alphanumeri
     return filters
 
 
+@cached_plan(lambda query, qparams: (query, qparams.query.request_parameters))
 def apply_request_parameters(query: Dict[str, List[dict]], qparams: RequestParams):
     collection = 'g_variants'
     LOG.debug("Request parameters len = {}".format(len(qparams.query.request_parameters)))
@@ -99,124 +102,92 @@ def apply_request_parameters(query: Dict[str, List[dict]], qparams: RequestParam
     return query
 
 
-def get_variants(entry_id: Optional[str], qparams: RequestParams):
+async def get_variants(entry_id: Optional[str], qparams: RequestParams):
     collection = 'g_variants'
+    count = await bitmaps.count_filters(collection, entry_id, qparams)
+    if count is not None:
+        return DefaultSchemas.GENOMICVARIATIONS, count, []
     query = apply_request_parameters({}, qparams)
     query = apply_filters(query, qparams.query.filters, collection)
     schema = DefaultSchemas.GENOMICVARIATIONS
-    count = get_count(client.beacon.genomicVariations, query)
-    docs = get_documents(
-        client.beacon.genomicVariations,
-        query,
-        qparams.query.pagination.skip,
-        qparams.query.pagination.limit
-    )
+    count, docs = await get_count_and_documents_by_ids(
+        client.beacon.genomicVariations, query, "variantInternalId", requested_ids(entry_id, qparams), qparams)
     return schema, count, docs
 
 
-def get_variant_with_id(entry_id: Optional[str], qparams: RequestParams):
+async def get_variant_with_id(entry_id: Optional[str], qparams: RequestParams):
     collection = 'g_variants'
-    query = {"$and": [{"variantInternalId": entry_id}]}
-    query = apply_request_parameters(query, qparams)
+    query = apply_request_parameters({}, qparams)
     query = apply_filters(query, qparams.query.filters, collection)
     schema = DefaultSchemas.GENOMICVARIATIONS
-    count = get_count(client.beacon.genomicVariations, query)
-    docs = get_documents(
-        client.beacon.genomicVariations,
-        query,
-        qparams.query.pagination.skip,
-        qparams.query.pagination.limit
-    )
+    count, docs = await get_count_and_documents_by_ids(
+        client.beacon.genomicVariations, query, "variantInternalId", requested_ids(entry_id, qparams), qparams)
     return schema, count, docs
 
 
-def get_biosamples_of_variant(entry_id: Optional[str], qparams: RequestParams):
+async def get_biosamples_of_variant(entry_id: Optional[str], qparams: RequestParams):
     collection = 'g_variants'
     query = {"$and": [{"variantInternalId": entry_id}]}
     query = apply_request_parameters(query, qparams)
-    query = apply_filters(query, qparams.query.filter, collection)
-    count = get_count(client.beacon.genomicVariations, query)
-    biosample_ids = client.beacon.genomicVariations \
-        .find_one(query, {"caseLevelData.biosampleId": 1, "_id": 0})
-    
-    biosample_ids=get_cross_query_variants(biosample_ids,'biosampleId','id')
-    query = apply_filters(biosample_ids, qparams.query.filters, collection)
-
+    query = apply_filters(query, qparams.query.filters, collection)
     schema = DefaultSchemas.BIOSAMPLES
-    count = get_count(client.beacon.biosamples, query)
-    docs = get_documents(
-        client.beacon.biosamples,
+    count, docs = await get_related_count_and_documents(
+        client.beacon.genomicVariations,
         query,
-        qparams.query.pagination.skip,
-        qparams.query.pagination.limit
+        client.beacon.biosamples,
+        apply_filters({}, qparams.query.filters, collection),
+        qparams,
+        entry_id
     )
     return schema, count, docs
 
 
-def get_individuals_of_variant(entry_id: Optional[str], qparams: RequestParams):
+async def get_individuals_of_variant(entry_id: Optional[str], qparams: RequestParams):
     collection = 'g_variants'
     query = {"$and": [{"variantInternalId": entry_id}]}
     query = apply_request_parameters(query, qparams)
     query = apply_filters(query, qparams.query.filters, collection)
-    count = get_count(client.beacon.genomicVariations, query)
-    individual_ids = client.beacon.genomicVariations \
-        .find_one(query, {"caseLevelData.biosampleId": 1, "_id": 0})
-
-    individual_ids = get_cross_query_variants(individual_ids,'biosampleId','id')
-    query = apply_filters(individual_ids, qparams.query.filters, collection)
-
     schema = DefaultSchemas.INDIVIDUALS
-    count = get_count(client.beacon.individuals, query)
-    docs = get_documents(
-        client.beacon.individuals,
+    count, docs = await get_related_count_and_documents(
+        client.beacon.genomicVariations,
         query,
-        qparams.query.pagination.skip,
-        qparams.query.pagination.limit
+        client.beacon.individuals,
+        apply_filters({}, qparams.query.filters, collection),
+        qparams,
+        entry_id
     )
     return schema, count, docs
 
 
-def get_runs_of_variant(entry_id: Optional[str], qparams: RequestParams):
+async def get_runs_of_variant(entry_id: Optional[str], qparams: RequestParams):
     collection = 'g_variants'
     query = {"$and": [{"variantInternalId": entry_id}]}
     query = apply_request_parameters(query, qparams)
     query = apply_filters(query, qparams.query.filters, collection)
-    count = get_count(client.beacon.genomicVariations, query)
-    run_ids = client.beacon.genomicVariations \
-        .find_one(query, {"caseLevelData.biosampleId": 1, "_id": 0})
-    
-    run_ids=get_cross_query_variants(run_ids,'biosampleId','biosampleId')
-    query = apply_filters(run_ids, qparams.query.filters, collection)
-
     schema = DefaultSchemas.RUNS
-    count = get_count(client.beacon.runs, query)
-    docs = get_documents(
-        client.beacon.runs,
+    count, docs = await get_related_count_and_documents(
+        client.beacon.genomicVariations,
         query,
-        qparams.query.pagination.skip,
-        qparams.query.pagination.limit
+        client.beacon.runs,
+        apply_filters({}, qparams.query.filters, collection),
+        qparams,
+        entry_id
     )
     return schema, count, docs
 
 
-def get_analyses_of_variant(entry_id: Optional[str], qparams: RequestParams):
+async def get_analyses_of_variant(entry_id: Optional[str], qparams: RequestParams):
     collection = 'g_variants'
     query = {"$and": [{"variantInternalId": entry_id}]}
     query = apply_request_parameters(query, qparams)
     query = apply_filters(query, qparams.query.filters, collection)
-    count = get_count(client.beacon.genomicVariations, query)
-    analysis_ids = client.beacon.genomicVariations \
-        .find_one(query, {"caseLevelData.biosampleId": 1, "_id": 0})
-
-    analysis_ids=get_cross_query_variants(analysis_ids,'biosampleId','biosampleId')
-    query = apply_filters(analysis_ids, qparams.query.filters, collection)
-
     schema = DefaultSchemas.ANALYSES
-    count = get_count(client.beacon.analyses, query)
-    docs = get_documents(
-        client.beacon.analyses,
+    count, docs = await get_related_count_and_documents(
+        client.beacon.genomicVariations,
         query,
-        qparams.query.pagination.skip,
-        qparams.query.pagination.limit
+        client.beacon.analyses,
+        apply_filters({}, qparams.query.filters, collection),
+        qparams,
+        entry_id
     )
     return schema, count, docs
@@ -0,0 +1,87 @@
+"""
+Joins between entities.
+
+The cross-entity routes (e.g. ``/api/g_variants/{id}/individuals/``) are resolved
+in a single aggregation on the parent collection: ``$match`` -> ``$lookup`` -> ``$facet``,
+instead of fetching the parent and copying its ids into an ``$in`` query.
+When the linkage index is built, unfiltered routes between the entity collections
+skip the join and read the related ``_id`` straight from it, and the members of
+datasets and cohorts are read from the membership cache.
+"""
+
+from typing import Any, Optional
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import ExecutionTimeout
+
+from beacon.db import budget, deferred, explain, linkage, membership, with_collection_options
+from beacon.db.projections import build_projection
+from beacon.db.relationships import get_field_values, get_relationship
+from beacon.db.utils import (PartialCount, get_count_and_documents, get_count_and_documents_in,
+                             get_pipeline_count_and_documents)
+from beacon.request.model import RequestParams
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+def contains_text_search(query: Any) -> bool:
+    if isinstance(query, dict):
+        return "$text" in query or any(contains_text_search(v) for v in query.values())
+    elif isinstance(query, list):
+        return any(contains_text_search(v) for v in query)
+    return False
+
+
+async def get_related_count_and_documents(source: AsyncIOMotorCollection,
+                                          source_query: dict,
+                                          target: AsyncIOMotorCollection,
+                                          target_query: dict,
+                                          qparams: RequestParams,
+                                          entry_id: Optional[str] = None):
+    source_field, target_field = get_relationship(source.name, target.name)
+
+    if entry_id is not None and not qparams.query.filters and not qparams.query.request_parameters:
+        related = linkage.get_related(source.name, entry_id, target.name)
+        if related is not None:
+            LOG.debug("Linkage index hit for {} -> {}".format(source.name, target.name))
+            return await get_count_and_documents_in(target, target_query, "_id", related, qparams)
+
+        if membership.is_enabled(source):
+            # The members are passed as they are cached, without fetching the parent
+            members = await membership.get_members(source, entry_id, source_field)
+            return await get_count_and_documents_in(target, target_query, target_field, members, qparams)
+
+    if contains_text_search(target_query) or deferred.has_placeholders(target_query):
+        # $text can only be evaluated in the first stage of a pipeline, and the placeholders
+        # may stand for long lists of values, queried in chunks outside of a pipeline,
+        # so the parent is resolved first and the target queried on its ids
+        LOG.debug("Joining {} with {} in two steps".format(target.name, source.name))
+        source_query = await deferred.resolve(source_query)
+        explain.record(source, "find", filter=source_query, projection={source_field: 1, "_id": 0}, limit=1)
+        try:
+            parent = await with_collection_options(source).find_one(
+                source_query, {source_field: 1, "_id": 0}, max_time_ms=budget.remaining_ms())
+        except ExecutionTimeout:
+            budget.mark_partial("parent lookup on {}".format(source.name))
+            return PartialCount(0), []
+        query = {"$and": [{target_field: {"$in": get_field_values(parent, source_field)}}, target_query]}
+        return await get_count_and_documents(target, query, qparams)
+
+    pipeline = [
+        {"$match": source_query},
+        # The cross-entity routes are about a single parent entry
+        {"$limit": 1},
+        {"$lookup": {
+            "from": target.name,
+            "localField": source_field,
+            "foreignField": target_field,
+            "as": "_related"
+        }},
+        {"$unwind": "$_related"},
+        {"$replaceRoot": {"newRoot": "$_related"}},
+    ]
+    if target_query:
+        pipeline.append({"$match": target_query})
+    return await get_pipeline_count_and_documents(source, pipeline, qparams, build_projection(target.name, qparams))
@@ -0,0 +1,148 @@
+"""In-memory adjacency between the entries of the entity collections, to serve the unfiltered cross-entity routes."""
+
+import asyncio
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from bson.objectid import ObjectId
+
+from beacon import conf
+from beacon.db import client
+from beacon.db.relationships import RELATIONSHIPS, get_field_values
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+# Collections whose entries are linked through their embedded ids, and their entry id field
+ENTRY_ID_FIELDS = {
+    'analyses': 'id',
+    'biosamples': 'id',
+    'genomicVariations': 'variantInternalId',
+    'individuals': 'id',
+    'runs': 'id',
+}
+
+
+class LinkageIndex:
+
+    def __init__(self):
+        # Per collection, the _id of every interned entry (sorted, the position is the integer id)
+        self.object_ids: Dict[str, List[ObjectId]] = {}
+        # Per collection, the integer id of the first entry with a given entry id
+        self.entry_ids: Dict[str, Dict[str, int]] = {}
+        # Per relationship, the CSR arrays: targets[offsets[i]:offsets[i + 1]] are related to i
+        self.adjacency: Dict[Tuple[str, str], Tuple[array, array]] = {}
+
+    def get_related(self, source: str, entry_id: str, target: str) -> Optional[List[ObjectId]]:
+        if (source, target) not in self.adjacency:
+            return None
+        i = self.entry_ids[source].get(entry_id)
+        if i is None:
+            # Maybe inserted since the index was built
+            return None
+        offsets, targets = self.adjacency[(source, target)]
+        target_object_ids = self.object_ids[target]
+        return [target_object_ids[j] for j in targets[offsets[i]:offsets[i + 1]]]
+
+    def get_integer_id(self, collection: str, object_id: ObjectId) -> Optional[int]:
+        object_ids = self.object_ids.get(collection, [])
+        i = bisect_left(object_ids, object_id)
+        return i if i < len(object_ids) and object_ids[i] == object_id else None
+
+
+_index: Optional[LinkageIndex] = None
+
+
+def is_ready() -> bool:
+    return _index is not None
+
+
+def get_related(source: str, entry_id: str, target: str) -> Optional[List[ObjectId]]:
+    """Returns the _id of the target entries related to an entry, or None if the relationship or the entry is not indexed."""
+    if _index is None:
+        return None
+    return _index.get_related(source, entry_id, target)
+
+
+async def _scan(collection_name: str, fields: List[str]) -> Tuple[List[ObjectId], Dict[str, List[list]]]:
+    projection = {field: 1 for field in fields}
+    object_ids = []
+    values = {field: [] for field in fields}
+    cursor = client.beacon.get_collection(collection_name).find({}, projection).sort("_id", 1)
+    async for document in cursor:
+        object_ids.append(document["_id"])
+        for field in fields:
+            values[field].append(get_field_values(document, field))
+    return object_ids, values
+
+
+async def build():
+    global _index
+    LOG.info("Building the linkage index")
+    index = LinkageIndex()
+    relationships = {
+        (source, target): fields
+        for (source, target), fields in RELATIONSHIPS.items()
+        if source in ENTRY_ID_FIELDS and target in ENTRY_ID_FIELDS
+    }
+
+    # Fields to read from each collection
+    collection_fields = {name: {id_field} for name, id_field in ENTRY_ID_FIELDS.items()}
+    for (source, target), (source_field, target_field) in relationships.items():
+        collection_fields[source].add(source_field)
+        collection_fields[target].add(target_field)
+
+    field_values = {}
+    for name, fields in collection_fields.items():
+        object_ids, values = await _scan(name, sorted(fields))
+        index.object_ids[name] = object_ids
+        entry_ids = {}
+        for i, entry_id in enumerate(values[ENTRY_ID_FIELDS[name]]):
+            for value in entry_id:
+                entry_ids.setdefault(value, i)
+        index.entry_ids[name] = entry_ids
+        field_values[name] = values
+        LOG.debug("Linkage index: {} entries in {}".format(len(object_ids), name))
+
+    for (source, target), (source_field, target_field) in relationships.items():
+        # Integer ids of the target entries, by value of the target field
+        targets_by_value: Dict[str, List[int]] = {}
+        for j, values in enumerate(field_values[target][target_field]):
+            for value in values:
+                targets_by_value.setdefault(value, []).append(j)
+        offsets = array('I', [0])
+        targets = array('I')
+        for values in field_values[source][source_field]:
+            related = set()
+            for value in values:
+                related.update(targets_by_value.get(value, []))
+            targets.extend(sorted(related))
+            offsets.append(len(targets))
+        index.adjacency[(source, target)] = (offsets, targets)
+
+    _index = index
+    LOG.info("Linkage index built")
+
+
+async def _has_new_entries(index: LinkageIndex) -> bool:
+    for name, object_ids in index.object_ids.items():
+        query = {"_id": {"$gt": object_ids[-1]}} if object_ids else {}
+        if await client.beacon.get_collection(name).find_one(query, {"_id": 1}) is not None:
+            return True
+    return False
+
+
+async def refresh():
+    """Rebuilds the index if entries were inserted since it was built, its arrays can't be appended to."""
+    if _index is not None and await _has_new_entries(_index):
+        await build()
+
+
+async def run():
+    """Builds the index, then refreshes it periodically, until cancelled."""
+    await build()
+    while True:
+        await asyncio.sleep(conf.linkage_index_refresh_seconds)
+        await refresh()
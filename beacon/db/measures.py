@@ -0,0 +1,100 @@
+"""In-memory sorted values of the numeric measures of the individuals, per assay code, to serve the numeric filters."""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from bson.objectid import ObjectId
+
+from beacon import conf
+from beacon.db.memory_index import CollectionIndex, IndexSet
+
+
+class MeasuresIndex(CollectionIndex):
+
+    query = {"measures": {"$exists": True}}
+    projection = {"measures.assayCode.id": 1, "measures.measurementValue.quantity.value": 1}
+
+    def __init__(self):
+        super().__init__('individuals')
+        # Per assay code, the sorted values and the integer id of the individual of each value
+        self.columns: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # Values of the individuals read since the last commit
+        self.pending: Dict[str, Tuple[list, list]] = {}
+
+    def add(self, i: int, document: dict):
+        for measure in document.get("measures") or []:
+            if not isinstance(measure, dict):
+                continue
+            assay_code = (measure.get("assayCode") or {}).get("id")
+            value = ((measure.get("measurementValue") or {}).get("quantity") or {}).get("value")
+            if assay_code is None or not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            values, owners = self.pending.setdefault(assay_code, ([], []))
+            values.append(value)
+            owners.append(i)
+
+    def commit(self):
+        """Merges the values of the new individuals, per assay code, into the sorted columns."""
+        pending, self.pending = self.pending, {}
+        for assay_code, (values, owners) in pending.items():
+            values = np.array(values, dtype=np.float64)
+            owners = np.array(owners, dtype=np.uint32)
+            if assay_code in self.columns:
+                indexed_values, indexed_owners = self.columns[assay_code]
+                values = np.concatenate((indexed_values, values))
+                owners = np.concatenate((indexed_owners, owners))
+            order = np.argsort(values, kind='stable')
+            # Replaced at once, a match never sees the values without their owners
+            self.columns[assay_code] = (values[order], owners[order])
+
+    def match(self, assay_code: str, operator: str, value: float) -> Optional[np.ndarray]:
+        """Sorted integer ids of the individuals with a measure of the assay matching the operator."""
+        if assay_code not in self.columns:
+            return np.empty(0, dtype=np.uint32)
+        values, owners = self.columns[assay_code]
+        left = np.searchsorted(values, value, side='left')
+        right = np.searchsorted(values, value, side='right')
+        if operator == '$lt':
+            matches = owners[:left]
+        elif operator == '$lte':
+            matches = owners[:right]
+        elif operator == '$gt':
+            matches = owners[right:]
+        elif operator == '$gte':
+            matches = owners[left:]
+        elif operator == '$eq':
+            matches = owners[left:right]
+        elif operator == '$ne':
+            matches = np.concatenate((owners[:left], owners[right:]))
+        else:
+            return None
+        # An individual may have several measures of the same assay
+        return np.unique(matches)
+
+    def get_object_ids(self, integer_ids: np.ndarray) -> List[ObjectId]:
+        return [self.object_ids[i] for i in integer_ids]
+
+
+indexes = IndexSet('measures', lambda: [MeasuresIndex()])
+
+
+def is_ready() -> bool:
+    return indexes.get('individuals') is not None
+
+
+def get_object_ids(assay_code: str, operator: str, value: float, max_ids: int) -> Optional[List[ObjectId]]:
+    """
+    Returns the _id of the individuals with a measure of the assay matching the operator,
+    or None if the index is not built, the operator is not supported or too many match.
+    """
+    index = indexes.get('individuals')
+    if index is None:
+        return None
+    matches = index.match(assay_code, operator, value)
+    if matches is None or len(matches) > max_ids:
+        return None
+    return index.get_object_ids(matches)
+
+
+async def run():
+    await indexes.run(conf.measures_index_refresh_seconds)
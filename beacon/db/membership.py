@@ -0,0 +1,55 @@
+"""
+Membership cache.
+
+The members of a dataset or a cohort (the ``ids.biosampleIds`` / ``ids.individualIds``
+of its document) are kept in memory as sorted tuples, keyed by the dataset or cohort
+id and the data version (``conf.update_datetime``), so the routes about its members
+don't fetch the parent document on every request.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from beacon import conf
+from beacon.db import budget, explain, with_collection_options
+from beacon.db.relationships import get_field_values
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+# Collections whose documents list their members
+MEMBER_COLLECTIONS = {'datasets', 'cohorts'}
+
+_cache: 'OrderedDict[tuple, Tuple[float, Tuple[str, ...]]]' = OrderedDict()
+
+
+def is_enabled(collection: AsyncIOMotorCollection) -> bool:
+    return collection.name in MEMBER_COLLECTIONS and conf.membership_cache_size > 0
+
+
+async def get_members(collection: AsyncIOMotorCollection, entry_id: str, field: str) -> Tuple[str, ...]:
+    key = (collection.name, entry_id, field, conf.update_datetime)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        _cache.move_to_end(key)
+        return cached[1]
+
+    explain.record(collection, "find", filter={"id": entry_id}, projection={field: 1, "_id": 0}, limit=1)
+    parent = await with_collection_options(collection).find_one(
+        {"id": entry_id}, {field: 1, "_id": 0}, max_time_ms=budget.remaining_ms())
+    members = tuple(sorted(set(get_field_values(parent, field))))
+    LOG.debug("Membership cache: {} members in {} {}".format(len(members), collection.name, entry_id))
+
+    _cache[key] = (time.monotonic() + conf.membership_cache_ttl, members)
+    _cache.move_to_end(key)
+    while len(_cache) > conf.membership_cache_size:
+        _cache.popitem(last=False)
+    return members
+
+
+def clear():
+    _cache.clear()
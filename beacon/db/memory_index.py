@@ -0,0 +1,94 @@
+"""In-memory indexes built when the beacon starts and refreshed with the documents inserted since."""
+
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+from bson.objectid import ObjectId
+
+from beacon.db import client, plans
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class CollectionIndex:
+    """
+    Index of the documents of a collection, interned as integers (their position in ``object_ids``)
+    in the order of their ``_id``, so the documents inserted since the last read are the ones after it.
+    """
+
+    # Documents indexed, and fields read from them
+    query: dict = {}
+    projection: Optional[dict] = None
+
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+        self.object_ids: List[ObjectId] = []
+
+    def add(self, i: int, document: dict):
+        raise NotImplementedError
+
+    def commit(self):
+        """Called once the documents read by a refresh are added."""
+
+    def optimize(self):
+        """Called once the index is built."""
+
+    async def refresh_since(self, last_id: Optional[ObjectId]) -> int:
+        query = self.query
+        if last_id is not None:
+            query = {"$and": [query, {"_id": {"$gt": last_id}}]} if query else {"_id": {"$gt": last_id}}
+        count = 0
+        cursor = client.beacon.get_collection(self.collection_name).find(query, self.projection).sort("_id", 1)
+        async for document in cursor:
+            i = len(self.object_ids)
+            self.object_ids.append(document["_id"])
+            self.add(i, document)
+            count += 1
+        self.commit()
+        return count
+
+    async def refresh(self) -> int:
+        return await self.refresh_since(self.object_ids[-1] if self.object_ids else None)
+
+
+class IndexSet:
+    """Indexes of one kind, one per collection, swapped at once when built."""
+
+    def __init__(self, name: str, make_indexes: Callable[[], List[CollectionIndex]]):
+        self.name = name
+        self.make_indexes = make_indexes
+        self.indexes: Dict[str, CollectionIndex] = {}
+
+    def get(self, collection_name: str) -> Optional[CollectionIndex]:
+        return self.indexes.get(collection_name)
+
+    async def build(self):
+        LOG.info("Building the {} index".format(self.name))
+        indexes = self.make_indexes()
+        for index in indexes:
+            await index.refresh()
+            index.optimize()
+            LOG.debug("{} index: {} documents of {}".format(self.name.capitalize(), len(index.object_ids), index.collection_name))
+        self.indexes = {index.collection_name: index for index in indexes}
+        # The filters compiled before can now be served by the index
+        plans.cache.clear()
+        LOG.info("{} index built".format(self.name.capitalize()))
+
+    async def refresh(self):
+        """Adds the documents inserted since the indexes were built or last refreshed."""
+        added = 0
+        for index in list(self.indexes.values()):
+            added += await index.refresh()
+        if added:
+            # The plans compiled before miss the new documents
+            plans.cache.clear()
+            LOG.debug("{} index: {} documents added".format(self.name.capitalize(), added))
+
+    async def run(self, interval: int):
+        """Builds the indexes, then refreshes them every ``interval`` seconds, until cancelled."""
+        await self.build()
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh()
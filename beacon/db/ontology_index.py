@@ -0,0 +1,91 @@
+"""In-memory bitmaps of the documents containing each ontology term, to serve the ontology filters."""
+
+import re
+from typing import Dict, Iterable, List, Optional
+
+from bson.objectid import ObjectId
+from pyroaring import BitMap
+
+from beacon import conf
+from beacon.db.memory_index import CollectionIndex, IndexSet
+from beacon.request import ontologies
+from beacon.request.model import OntologyFilter, Similarity
+
+# Same terms as the ones extracted to the filtering terms
+ONTOLOGY_REGEX = re.compile(r"([_A-Za-z]+):([_A-Za-z0-9^\-]+)")
+
+COLLECTIONS = ['analyses', 'biosamples', 'genomicVariations', 'individuals', 'runs']
+
+
+class OntologyIndex(CollectionIndex):
+
+    def __init__(self, collection_name: str):
+        super().__init__(collection_name)
+        self.integer_ids: Dict[ObjectId, int] = {}
+        self.postings: Dict[str, BitMap] = {}
+        # Every interned document, for the complement of a bitmap
+        self.documents = BitMap()
+
+    def add(self, i: int, document: dict):
+        self.integer_ids[document["_id"]] = i
+        self.documents.add(i)
+        for term in document_terms(document):
+            self.postings.setdefault(term, BitMap()).add(i)
+
+    def optimize(self):
+        for bitmap in self.postings.values():
+            bitmap.run_optimize()
+        self.documents.run_optimize()
+
+    def any_of(self, terms: Iterable[str]) -> BitMap:
+        return BitMap.union(BitMap(), *(self.postings[term] for term in terms if term in self.postings))
+
+    def complement(self, bitmap: BitMap) -> BitMap:
+        return self.documents - bitmap
+
+    def get_object_ids(self, bitmap: BitMap) -> List[ObjectId]:
+        return [self.object_ids[i] for i in bitmap]
+
+
+def document_terms(value) -> set:
+    terms = set()
+    if isinstance(value, str):
+        terms.update(':'.join(match) for match in ONTOLOGY_REGEX.findall(value))
+    elif isinstance(value, list):
+        for v in value:
+            terms.update(document_terms(v))
+    elif isinstance(value, dict):
+        for v in value.values():
+            terms.update(document_terms(v))
+    return terms
+
+
+indexes = IndexSet('ontology', lambda: [OntologyIndex(collection_name) for collection_name in COLLECTIONS])
+
+
+def get_index(collection: str) -> Optional[OntologyIndex]:
+    return indexes.get(collection)
+
+
+def filter_terms(filter: OntologyFilter) -> Optional[List[str]]:
+    """Terms matched by an ontology filter, or None if they can't be known in advance."""
+    if filter.similarity != Similarity.EXACT:
+        return None
+    if filter.include_descendant_terms:
+        return [filter.id] + ontologies.get_descendants(filter.id)
+    return [filter.id]
+
+
+def get_bitmap(collection: str, filter: OntologyFilter) -> Optional[BitMap]:
+    """Documents matching an ontology filter, or None if the collection or the filter can't be served by the index."""
+    index = indexes.get(collection)
+    if index is None:
+        return None
+    terms = filter_terms(filter)
+    if terms is None:
+        return None
+    return index.any_of(terms)
+
+
+async def run():
+    await indexes.run(conf.ontology_index_refresh_seconds)
@@ -0,0 +1,102 @@
+"""
+Query plan cache.
+
+The Mongo queries compiled from the filters and request parameters of a request only
+depend on them (and on the ontologies loaded), so they are kept in an LRU cache keyed
+by a canonical hash of their arguments, instead of being rebuilt on every request.
+The lists of documents found by the in-memory indexes, which can be long, are kept in
+the queries as tuples, shared by the cached query and its copies.
+"""
+
+import functools
+import hashlib
+import json
+from collections import OrderedDict
+from copy import copy
+from typing import Any, Callable
+
+from beacon import conf
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class PlanCache:
+
+    def __init__(self):
+        self.plans: 'OrderedDict[str, Any]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        plan = self.plans.get(key)
+        if plan is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.plans.move_to_end(key)
+        return plan
+
+    def put(self, key: str, plan):
+        self.plans[key] = plan
+        self.plans.move_to_end(key)
+        while len(self.plans) > conf.plan_cache_size:
+            self.plans.popitem(last=False)
+
+    def clear(self):
+        self.plans.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self.plans),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+cache = PlanCache()
+
+
+def canonical_key(*parts) -> str:
+    # Same arguments in any key order give the same hash
+    canonical = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def copy_plan(plan: Any) -> Any:
+    """Copies the dicts and lists of a query, which the query builders modify, but not its tuples, which they don't."""
+    if isinstance(plan, dict):
+        # Same type, e.g. the defaultdict of the $text searches
+        plan = copy(plan)
+        for key, value in plan.items():
+            plan[key] = copy_plan(value)
+        return plan
+    if isinstance(plan, list):
+        return [copy_plan(value) for value in plan]
+    return plan
+
+
+def cached_plan(arguments: Callable[..., Any]):
+    """
+    Caches the query returned by a query builder, keyed by the builder and the part of
+    its arguments given by `arguments`. The builders may modify the query they are given,
+    so every call gets its own copy of the cached query.
+    """
+    def decorator(build):
+        @functools.wraps(build)
+        def wrapper(*args, **kwargs):
+            if conf.plan_cache_size <= 0:
+                return build(*args, **kwargs)
+            key = canonical_key(build.__module__, build.__qualname__, conf.update_datetime,
+                                arguments(*args, **kwargs))
+            plan = cache.get(key)
+            if plan is None:
+                plan = build(*args, **kwargs)
+                cache.put(key, copy_plan(plan))
+                return plan
+            return copy_plan(plan)
+        return wrapper
+    return decorator
@@ -0,0 +1,48 @@
+from typing import Dict, List, Optional
+
+from beacon.db.schemas import DefaultSchemas
+from beacon.request.model import RequestParams
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+# Schema served by each collection
+COLLECTION_SCHEMAS = {
+    'analyses': DefaultSchemas.ANALYSES,
+    'biosamples': DefaultSchemas.BIOSAMPLES,
+    'cohorts': DefaultSchemas.COHORTS,
+    'datasets': DefaultSchemas.DATASETS,
+    'genomicVariations': DefaultSchemas.GENOMICVARIATIONS,
+    'individuals': DefaultSchemas.INDIVIDUALS,
+    'runs': DefaultSchemas.RUNS,
+}
+
+# Fields added at load time (provenance, query helpers) that are not part of the schemas
+# Note: _id is always returned, it is the key of the pagination tokens
+INTERNAL_FIELDS = {
+    'genomicVariations': ['_info', '_position'],
+}
+
+
+def requested_fields(collection_name: str, qparams: RequestParams) -> Optional[List[str]]:
+    if qparams.query.fields:
+        return qparams.query.fields
+    schema = COLLECTION_SCHEMAS.get(collection_name)
+    for requested_schema in qparams.meta.requested_schemas:
+        if schema is None or requested_schema != schema.value['schema']:
+            LOG.debug("Requested schema {} is not served by {}".format(requested_schema, collection_name))
+    # The documents are stored in the default schema: it is served whole, without the internal fields
+    return None
+
+
+def build_projection(collection_name: str, qparams: RequestParams) -> Optional[Dict[str, int]]:
+    fields = requested_fields(collection_name, qparams)
+    if fields:
+        projection = {field: 1 for field in fields}
+        projection['_id'] = 1
+        return projection
+    internal_fields = INTERNAL_FIELDS.get(collection_name, [])
+    if internal_fields:
+        return {field: 0 for field in internal_fields}
+    return None
@@ -0,0 +1,76 @@
+"""
+Relationships between entities.
+
+The relationship graph is shared by the join executor (``beacon.db.joins``),
+the linkage index (``beacon.db.linkage``) and the filters scoped to another
+entity (``beacon.db.deferred``).
+"""
+
+from typing import Any, List, Optional, Tuple
+
+
+# Relationship graph: (source collection, target collection) -> (source field, target field)
+RELATIONSHIPS = {
+    ('analyses', 'biosamples'): ('biosampleId', 'id'),
+    ('analyses', 'genomicVariations'): ('biosampleId', 'caseLevelData.biosampleId'),
+    ('analyses', 'individuals'): ('individualId', 'id'),
+    ('analyses', 'runs'): ('runId', 'id'),
+    ('biosamples', 'analyses'): ('id', 'biosampleId'),
+    ('biosamples', 'genomicVariations'): ('id', 'caseLevelData.biosampleId'),
+    ('biosamples', 'individuals'): ('individualId', 'id'),
+    ('biosamples', 'runs'): ('id', 'biosampleId'),
+    ('cohorts', 'individuals'): ('ids.individualIds', 'id'),
+    ('datasets', 'analyses'): ('ids.biosampleIds', 'biosampleId'),
+    ('datasets', 'biosamples'): ('ids.biosampleIds', 'id'),
+    ('datasets', 'individuals'): ('ids.individualIds', 'id'),
+    ('datasets', 'runs'): ('ids.biosampleIds', 'biosampleId'),
+    ('genomicVariations', 'analyses'): ('caseLevelData.biosampleId', 'biosampleId'),
+    ('genomicVariations', 'biosamples'): ('caseLevelData.biosampleId', 'id'),
+    ('genomicVariations', 'individuals'): ('caseLevelData.biosampleId', 'id'),
+    ('genomicVariations', 'runs'): ('caseLevelData.biosampleId', 'biosampleId'),
+    ('individuals', 'analyses'): ('id', 'individualId'),
+    ('individuals', 'biosamples'): ('id', 'individualId'),
+    ('individuals', 'genomicVariations'): ('id', 'caseLevelData.biosampleId'),
+    ('individuals', 'runs'): ('id', 'individualId'),
+    ('runs', 'analyses'): ('id', 'runId'),
+    ('runs', 'biosamples'): ('biosampleId', 'id'),
+    ('runs', 'genomicVariations'): ('biosampleId', 'caseLevelData.biosampleId'),
+    ('runs', 'individuals'): ('individualId', 'id'),
+}
+
+
+# Fields holding several values per document, e.g. the biosamples a variant is found in
+MULTIVALUED_FIELDS = {
+    ('cohorts', 'ids.individualIds'),
+    ('datasets', 'ids.biosampleIds'),
+    ('datasets', 'ids.individualIds'),
+    ('genomicVariations', 'caseLevelData.biosampleId'),
+}
+
+
+def get_relationship(source: str, target: str) -> Tuple[str, str]:
+    return RELATIONSHIPS[(source, target)]
+
+
+def is_multivalued(collection: str, field: str) -> bool:
+    return (collection, field) in MULTIVALUED_FIELDS
+
+
+def get_field_values(document: Optional[dict], field: str) -> List[Any]:
+    # Resolves a dotted path, flattening the arrays found on the way
+    values = [document] if document is not None else []
+    for key in field.split('.'):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                next_values += [v.get(key) for v in value if isinstance(v, dict)]
+            elif isinstance(value, dict):
+                next_values.append(value.get(key))
+        values = next_values
+    flat_values = []
+    for value in values:
+        if isinstance(value, list):
+            flat_values += value
+        elif value is not None:
+            flat_values.append(value)
+    return flat_values
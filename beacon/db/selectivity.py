@@ -0,0 +1,218 @@
+"""
+Selectivity of the query clauses.
+
+A small cost model, loaded when the beacon starts, from the counts stored in the
+``filtering_terms`` collection (documents containing each ontology term, distinct
+values of each field), the size of the collections and their indexes. It estimates
+the fraction of the documents each clause of a ``$and`` matches. When several indexes
+can serve a query, the index of its most selective clause is hinted: the MongoDB planner
+doesn't depend on the order of the clauses, and it picks among the candidate indexes
+with a short trial run, which favours the index finding the first matches soonest, not
+the one examining the fewest documents.
+When the debug logs are on, the estimate of every query is logged next to the actual
+fraction of the documents it matched, to tune the model.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from beacon import conf
+from beacon.db import client
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+COLLECTIONS = ['analyses', 'biosamples', 'cohorts', 'datasets', 'genomicVariations', 'individuals', 'runs']
+
+# Fraction of the documents matched by the clauses the model knows nothing about
+DEFAULT_SELECTIVITY = 0.1
+RANGE_SELECTIVITY = 1 / 3
+UNANCHORED_REGEX_SELECTIVITY = 0.5
+
+_sizes: Dict[str, int] = {}
+# Per collection, documents containing an ontology term, and distinct values of a field
+_term_counts: Dict[Tuple[str, str], int] = {}
+_distinct_counts: Dict[Tuple[str, str], int] = {}
+# Per collection, the index of the first field of each index, the fields of each index,
+# and whether it has a text index
+_indexed_fields: Dict[str, Dict[str, str]] = {}
+_index_keys: Dict[str, Dict[str, List[str]]] = {}
+_text_indexes: set = set()
+
+
+def is_loaded(collection: str) -> bool:
+    return collection in _sizes
+
+
+def estimate(collection: str, clause: Any) -> float:
+    """Estimated fraction of the documents of the collection matched by a clause."""
+    if not isinstance(clause, dict) or not clause:
+        return 1.0
+    selectivity = 1.0
+    for key, value in clause.items():
+        if key == '$and':
+            for subclause in value:
+                selectivity *= estimate(collection, subclause)
+        elif key == '$or':
+            selectivity *= min(1.0, sum(estimate(collection, subclause) for subclause in value))
+        elif key == '$text':
+            selectivity *= _estimate_text(collection, value.get('$search', ''))
+        elif key == '$complement':
+            selectivity *= 1 - estimate(collection, value['positive'])
+        elif key == '$semijoin':
+            selectivity *= DEFAULT_SELECTIVITY
+        else:
+            selectivity *= _estimate_field(collection, key, value)
+    return selectivity
+
+
+def _estimate_text(collection: str, search: str) -> float:
+    size = _sizes.get(collection)
+    phrases = re.findall(r'"([^"]+)"', search)
+    terms = phrases or search.split()
+    counts = [_term_counts[(collection, term)] for term in terms if (collection, term) in _term_counts]
+    if not size or not counts:
+        return DEFAULT_SELECTIVITY
+    # The phrases must all be found, the terms are alternatives
+    count = min(counts) if phrases else sum(counts)
+    return min(1.0, count / size)
+
+
+def _estimate_field(collection: str, field: str, value: Any) -> float:
+    size = _sizes.get(collection)
+    if field == '_id':
+        if isinstance(value, dict) and '$in' in value:
+            return min(1.0, len(value['$in']) / size) if size else DEFAULT_SELECTIVITY
+        return 1 / size if size else DEFAULT_SELECTIVITY
+    distinct = _distinct_counts.get((collection, field))
+    equality = 1 / distinct if distinct else DEFAULT_SELECTIVITY
+    if not isinstance(value, dict) or not any(k.startswith('$') for k in value):
+        return equality
+    selectivity = 1.0
+    for operator, operand in value.items():
+        if operator == '$eq':
+            selectivity *= equality
+        elif operator == '$in':
+            selectivity *= min(1.0, equality * len(operand))
+        elif operator in ('$gt', '$gte', '$lt', '$lte', '$elemMatch'):
+            selectivity *= RANGE_SELECTIVITY
+        elif operator == '$regex':
+            selectivity *= DEFAULT_SELECTIVITY if str(operand).startswith('^') else UNANCHORED_REGEX_SELECTIVITY
+        elif operator in ('$ne', '$nin', '$not'):
+            selectivity *= 1 - equality
+    return selectivity
+
+
+def is_indexed(collection: str, clause: Any) -> bool:
+    """Whether an index can serve the clause, so that it can drive the plan."""
+    if not isinstance(clause, dict):
+        return False
+    for key, value in clause.items():
+        if key == '$and':
+            if any(is_indexed(collection, subclause) for subclause in value):
+                return True
+        elif key == '$or':
+            if value and all(is_indexed(collection, subclause) for subclause in value):
+                return True
+        elif key == '$text':
+            if collection in _text_indexes:
+                return True
+        elif key == '_id' or key in _indexed_fields.get(collection, ()):
+            if not isinstance(value, dict) or not set(value) & {'$ne', '$nin', '$not'}:
+                return True
+    return False
+
+
+def _clauses(query: dict) -> List[dict]:
+    # The clauses of the top level $and (and of the query itself)
+    clauses = []
+    for key, value in query.items():
+        if key == '$and':
+            for clause in value:
+                if isinstance(clause, dict):
+                    clauses.extend(_clauses(clause))
+        else:
+            clauses.append({key: value})
+    return clauses
+
+
+def _has_text(value: Any) -> bool:
+    if isinstance(value, dict):
+        return '$text' in value or any(_has_text(v) for v in value.values())
+    elif isinstance(value, list):
+        return any(_has_text(v) for v in value)
+    return False
+
+
+def choose_index(collection: str, query: Any, sort: Optional[str] = None) -> Optional[str]:
+    """Name of the index to hint to a query sorted on a field, or None to let the planner choose."""
+    if not conf.selectivity_hint_enabled or not is_loaded(collection):
+        return None
+    if not isinstance(query, dict) or _has_text(query):
+        # A $text search can only be served by the text index
+        return None
+    candidates = {}
+    for clause in _clauses(query):
+        field = next(iter(clause))
+        index = _indexed_fields.get(collection, {}).get(field)
+        if index is not None and is_indexed(collection, clause):
+            candidates[index] = min(estimate(collection, clause), candidates.get(index, 1.0))
+    if len(candidates) < 2:
+        # Nothing to choose from
+        return None
+    if sort is not None:
+        # An index without the sort key would sort all the matches in memory
+        candidates = {index: selectivity for index, selectivity in candidates.items()
+                      if sort in _index_keys.get(collection, {}).get(index, [])}
+        if not candidates:
+            return None
+    return min(candidates, key=candidates.get)
+
+
+def log_selectivity(collection: str, query: dict, count: int):
+    if not LOG.isEnabledFor(logging.DEBUG) or not query or not _sizes.get(collection):
+        return
+    LOG.debug("Selectivity on {}: estimated {:.4f}, actual {:.4f} for {}".format(
+        collection, estimate(collection, query), count / _sizes[collection], query))
+
+
+async def load():
+    sizes, term_counts, distinct_counts, indexed_fields, index_keys, text_indexes = {}, {}, {}, {}, {}, set()
+    for collection_name in COLLECTIONS:
+        collection = client.beacon.get_collection(collection_name)
+        sizes[collection_name] = await collection.estimated_document_count()
+        indexed_fields[collection_name] = {}
+        index_keys[collection_name] = {}
+        for name, index in (await collection.index_information()).items():
+            if index.get("sparse") or "partialFilterExpression" in index:
+                # A hint forces the index, and it misses the documents it doesn't hold
+                continue
+            keys = index["key"]
+            if any(direction == "text" for _, direction in keys):
+                text_indexes.add(collection_name)
+            else:
+                indexed_fields[collection_name].setdefault(keys[0][0], name)
+                index_keys[collection_name][name] = [field for field, _ in keys]
+
+    projection = {"_id": 0, "id": 1, "collection": 1, "count": 1, "type": 1}
+    async for term in client.beacon.filtering_terms.find({"count": {"$exists": True}}, projection):
+        key = (term["collection"], term["id"])
+        if term.get("type") == "alphanumeric":
+            distinct_counts[key] = term["count"]
+        else:
+            term_counts[key] = term["count"]
+
+    _sizes.clear()
+    _sizes.update(sizes)
+    _term_counts.clear()
+    _term_counts.update(term_counts)
+    _distinct_counts.clear()
+    _distinct_counts.update(distinct_counts)
+    _indexed_fields.clear()
+    _indexed_fields.update(indexed_fields)
+    _index_keys.clear()
+    _index_keys.update(index_keys)
+    _text_indexes.clear()
+    _text_indexes.update(text_indexes)
+    LOG.info("Selectivity statistics loaded: {} terms".format(len(term_counts) + len(distinct_counts)))
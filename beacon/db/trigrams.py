@@ -0,0 +1,82 @@
+"""In-memory trigrams of the string fields used in LIKE filters, to narrow down the documents to verify."""
+
+from array import array
+from typing import Dict, Iterable, List, Optional, Set
+
+from bson.objectid import ObjectId
+
+from beacon import conf
+from beacon.db.memory_index import CollectionIndex, IndexSet
+from beacon.db.relationships import get_field_values
+
+# Markers of the start and end of the values, so anchored patterns only match at the ends
+START, END = '\x02', '\x03'
+
+
+class TrigramIndex(CollectionIndex):
+
+    def __init__(self, collection_name: str, fields: Iterable[str]):
+        super().__init__(collection_name)
+        # The documents are read in order of _id, so the integer ids are appended to sorted lists
+        self.postings: Dict[str, Dict[str, array]] = {field: {} for field in sorted(set(fields))}
+        self.projection = {field: 1 for field in self.postings}
+
+    def add(self, i: int, document: dict):
+        for field, postings in self.postings.items():
+            grams = set()
+            for value in get_field_values(document, field):
+                if isinstance(value, str):
+                    grams.update(trigrams(START + value + END))
+            for gram in grams:
+                postings.setdefault(gram, array('I')).append(i)
+
+    def candidates(self, field: str, pattern: str) -> Optional[Set[int]]:
+        """Integer ids of the documents whose field may match a LIKE pattern, or None if it's too short to tell."""
+        segments = pattern.split('%')
+        segments[0] = START + segments[0]
+        segments[-1] = segments[-1] + END
+        grams = set()
+        for segment in segments:
+            grams.update(trigrams(segment))
+        if not grams:
+            return None
+        field_postings = self.postings[field]
+        postings = sorted((field_postings.get(gram, array('I')) for gram in grams), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            if not result:
+                break
+            result.intersection_update(posting)
+        return result
+
+
+def trigrams(value: str) -> Set[str]:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+indexes = IndexSet('trigram', lambda: [
+    TrigramIndex(collection_name, fields) for collection_name, fields in conf.trigram_index_fields.items()
+])
+
+
+def is_indexed(collection: str, path: str) -> bool:
+    index = indexes.get(collection)
+    return index is not None and path in index.postings
+
+
+def get_candidates(collection: str, path: str, pattern: str) -> Optional[List[ObjectId]]:
+    """
+    Returns the _id of the documents whose field may match a LIKE pattern, or None if
+    the field is not indexed, the pattern can't narrow the documents down, or too many match.
+    """
+    if not is_indexed(collection, path):
+        return None
+    index = indexes.get(collection)
+    candidates = index.candidates(path, pattern)
+    if candidates is None or len(candidates) > conf.trigram_index_max_candidates:
+        return None
+    return [index.object_ids[i] for i in sorted(candidates)]
+
+
+async def run():
+    await indexes.run(conf.trigram_index_refresh_seconds)
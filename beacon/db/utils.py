@@ -1,13 +1,39 @@
-from typing import Dict, Optional
+import asyncio
+import base64
+import heapq
+import math
+import time
+from typing import Dict, List, Optional, Tuple
 
-from pymongo.cursor import Cursor
-from pymongo.collection import Collection
-from beacon.db import client
-from beacon.request.model import RequestParams
+from aiohttp import web
+from bson import json_util
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import ExecutionTimeout
+from beacon import conf
+from beacon.db import advisor, budget, client, deferred, explain, selectivity, with_collection_options
+from beacon.db.projections import build_projection
+from beacon.db.relationships import is_multivalued
+from beacon.request.model import Granularity, RequestParams
 import logging
 
 LOG = logging.getLogger(__name__)
 
+# z-score of the 95% confidence interval given for approximate counts
+_APPROXIMATE_COUNT_Z = 1.96
+
+
+class ApproximateCount(int):
+    """Count estimated from a sample, with the error bound of its 95% confidence interval."""
+
+    def __new__(cls, value: int, error_bound: int):
+        count = super().__new__(cls, value)
+        count.error_bound = error_bound
+        return count
+
+
+class PartialCount(int):
+    """Lower bound of a count that could not be completed within the query time budget."""
+
 
 def query_id(query: dict, document_id) -> dict:
     query["id"] = document_id
@@ -19,66 +45,482 @@ def query_ids(query: dict, ids) -> dict:
     return query
 
 
+def requested_ids(entry_id: Optional[str], qparams: RequestParams) -> List[str]:
+    """Ids of the path and of the request, without duplicates and in the order they were given."""
+    ids = [entry_id] if entry_id is not None else []
+    return list(dict.fromkeys(ids + qparams.query.ids))
+
+
 def query_property(query: dict, property_id: str, value: str, property_map: Dict[str, str]) -> dict:
     query[property_map[property_id]] = value
     return query
 
 
-def get_count(collection: Collection, query: dict) -> int:
+def hint_option(hint: Optional[str]) -> dict:
+    # The drivers take no hint rather than a None one
+    return {"hint": hint} if hint is not None else {}
+
+
+async def get_count(collection: AsyncIOMotorCollection, query: dict) -> int:
     if not query:
         LOG.debug("Returning estimated count")
-        return collection.estimated_document_count()
+        explain.record(collection, "count")
+        return await collection.estimated_document_count(maxTimeMS=budget.remaining_ms())
     else:
         LOG.debug("FINAL QUERY (COUNT): {}".format(query))
         LOG.debug("Returning count")
-        return collection.count_documents(query)
+        hint = selectivity.choose_index(collection.name, query)
+        explain.record(collection, "count", query=query, hint=hint)
+        return await collection.count_documents(query, maxTimeMS=budget.remaining_ms(), **hint_option(hint))
 
 
-def get_documents(collection: Collection, query: dict, skip: int, limit: int) -> Cursor:
+async def get_documents(collection: AsyncIOMotorCollection, query: dict, skip: int, limit: int, projection: Optional[dict] = None) -> List[dict]:
     LOG.debug("FINAL QUERY: {}".format(query))
-    return collection.find(query).skip(skip).limit(limit).max_time_ms(10 * 1000)
-
-def get_cross_query(ids: dict, cross_type: str, collection_id: str):
-    id_list=[]
-    dict_in={}
-    id_dict={}
-    if cross_type == 'biosampleId' or cross_type=='id':
-        list_item=ids[cross_type]
-        LOG.debug(str(list_item))
-        id_list.append(str(list_item))
-        dict_in["$in"]=id_list
-        LOG.debug(id_list)
-        id_dict[collection_id]=dict_in
-        query = id_dict
-    elif cross_type == 'individualIds' or cross_type=='biosampleIds':
-        list_individualIds=ids[cross_type]
-        dict_in["$in"]=list_individualIds
-        LOG.debug(list_individualIds)
-        id_dict[collection_id]=dict_in
-        query = id_dict
-    else:
-        for k, v in ids.items():
-            for item in v:
-                id_list.append(item[cross_type])
-        dict_in["$in"]=id_list
-        id_dict[collection_id]=dict_in
-        query = id_dict
+    # Pages are sorted by _id so the last document can be used as a page token
+    hint = selectivity.choose_index(collection.name, query, sort="_id")
+    explain.record(collection, "find", filter=query, projection=projection, sort={"_id": 1}, skip=skip, limit=limit or None, hint=hint)
+    cursor = collection.find(query, projection).hint(hint).sort("_id", 1).skip(skip).limit(limit).max_time_ms(budget.remaining_ms())
+    return await fetch_documents(cursor)
 
 
-    LOG.debug(query)
-    return query
+async def fetch_documents(cursor) -> List[dict]:
+    # The documents are read one batch at a time, so the ones already
+    # fetched can still be returned if the time budget runs out
+    docs = []
+    try:
+        async for doc in cursor:
+            docs.append(doc)
+    except ExecutionTimeout:
+        budget.mark_partial("{} documents fetched".format(len(docs)))
+    return docs
 
-def get_cross_query_variants(ids: dict, cross_type: str, collection_id: str):
-    id_list=[]
-    dict_in={}
-    id_dict={}
-    for k, v in ids.items():
-        for item in v:
-            id_list.append(item[cross_type])
-    dict_in["$in"]=id_list
-    id_dict[collection_id]=dict_in
-    query = id_dict
 
+def encode_page_token(document: dict) -> str:
+    # The token is the sort key of the last document of a page
+    key = json_util.dumps({"_id": document["_id"]})
+    return base64.urlsafe_b64encode(key.encode()).decode()
 
-    LOG.debug(query)
-    return query
+
+def decode_page_token(token: str) -> dict:
+    try:
+        key = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+        return {"_id": {"$gt": key["_id"]}}
+    except (ValueError, KeyError, TypeError):
+        raise web.HTTPBadRequest(reason="Invalid pagination token: {}".format(token))
+
+
+async def get_documents_after(collection: AsyncIOMotorCollection, query: dict, seek: dict, limit: int, projection: Optional[dict] = None) -> List[dict]:
+    page_query = {"$and": [query, seek]} if query else seek
+    LOG.debug("FINAL QUERY (PAGE): {}".format(page_query))
+    # The seek predicate is resolved with the _id index, whatever the page number
+    explain.record(collection, "find", filter=page_query, projection=projection, sort={"_id": 1}, limit=limit or None)
+    cursor = collection.find(page_query, projection).sort("_id", 1).limit(limit).max_time_ms(budget.remaining_ms())
+    return await fetch_documents(cursor)
+
+
+async def get_existence(collection: AsyncIOMotorCollection, query: dict, max_time_ms: Optional[int] = None) -> bool:
+    LOG.debug("FINAL QUERY (EXISTS): {}".format(query))
+    # Only the _id is projected so the probe stops at the first match
+    # without fetching the document
+    hint = selectivity.choose_index(collection.name, query)
+    explain.record(collection, "find", filter=query, projection={"_id": 1}, limit=1, hint=hint)
+    cursor = collection.find(query, {"_id": 1}).hint(hint).limit(1).max_time_ms(max_time_ms or budget.remaining_ms())
+    docs = await cursor.to_list(length=1)
+    return len(docs) > 0
+
+
+async def get_partial_count(collection: AsyncIOMotorCollection, query: dict) -> PartialCount:
+    # The count ran out of time: at least tell whether there is a match
+    budget.mark_partial("count on {}".format(collection.name))
+    try:
+        return PartialCount(await get_existence(collection, query, budget.grace_ms()))
+    except ExecutionTimeout:
+        return PartialCount(0)
+
+
+async def get_approximate_count(collection: AsyncIOMotorCollection, query: dict) -> int:
+    total = await collection.estimated_document_count()
+    sample_size = conf.approximate_count_sample_size
+    if not query or total <= conf.approximate_count_threshold or total <= sample_size:
+        return await get_count(collection, query)
+
+    # Count the matches among a random sample of the collection.
+    # The sample is passed as an _id list, so the query can still use $text
+    # (which must be evaluated in the first stage of the pipeline)
+    LOG.debug("FINAL QUERY (APPROXIMATE COUNT): {}".format(query))
+    sample = await collection \
+        .aggregate([{"$sample": {"size": sample_size}}, {"$project": {"_id": 1}}], maxTimeMS=budget.remaining_ms()) \
+        .to_list(length=sample_size)
+    sample_ids = [doc["_id"] for doc in sample]
+    explain.record(collection, "count", query={"$and": [query, {"_id": {"$in": sample_ids}}]})
+    hits = await collection.count_documents({"$and": [query, {"_id": {"$in": sample_ids}}]},
+                                            maxTimeMS=budget.remaining_ms())
+
+    if hits == 0 and not await get_existence(collection, query):
+        return 0
+
+    # Wilson score interval of the sampled proportion
+    n = len(sample_ids)
+    z = _APPROXIMATE_COUNT_Z
+    p = hits / n
+    error = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return ApproximateCount(max(1, round(p * total)), math.ceil(error * total))
+
+
+async def get_count_and_documents(collection: AsyncIOMotorCollection,
+                                  query: dict,
+                                  qparams: RequestParams,
+                                  granularity: Optional[Granularity] = None) -> Tuple[int, List[dict]]:
+    collection = with_collection_options(collection)
+    query, semijoin = await deferred.resolve_semijoin(query, conf.semijoin_chunk_size)
+    if semijoin is not None:
+        # The values of a long semi-join are queried a chunk at a time
+        field, values = semijoin
+        if is_multivalued(collection.name, field):
+            field, values = "_id", await get_ids_in(collection, query, field, values)
+            if (granularity or qparams.returned_granularity()) == Granularity.COUNT:
+                # The ids are distinct, counting them again by chunks would add nothing
+                return PartialCount(len(values)) if budget.is_partial() else len(values), []
+        return await get_count_and_documents_in(collection, query, field, values, qparams, granularity)
+    start = time.monotonic()
+    try:
+        count, docs = await _get_count_and_documents(collection, query, qparams, granularity)
+    finally:
+        if advisor.is_enabled():
+            advisor.record(collection.name, query, (time.monotonic() - start) * 1000)
+    if (granularity or qparams.returned_granularity()) != Granularity.BOOLEAN and type(count) is int:
+        # Approximate and partial counts would mislead the model
+        selectivity.log_selectivity(collection.name, query, count)
+    return count, docs
+
+
+async def _get_count_and_documents(collection: AsyncIOMotorCollection,
+                                   query: dict,
+                                   qparams: RequestParams,
+                                   granularity: Optional[Granularity]) -> Tuple[int, List[dict]]:
+    if granularity is None:
+        granularity = qparams.returned_granularity()
+    if granularity == Granularity.BOOLEAN:
+        # A boolean response only needs to know whether there is a match
+        try:
+            exists = await get_existence(collection, query)
+        except ExecutionTimeout:
+            # Not a negative answer: the response tells that the existence is unknown
+            budget.mark_partial("existence on {}".format(collection.name))
+            exists = False
+        return int(exists), []
+    elif granularity == Granularity.COUNT:
+        # No record is returned, so there is no page to fetch
+        try:
+            if conf.approximate_count_enabled:
+                count = await get_approximate_count(collection, query)
+            else:
+                count = await get_count(collection, query)
+        except ExecutionTimeout:
+            count = await get_partial_count(collection, query)
+        return count, []
+
+    skip = qparams.query.pagination.skip
+    limit = qparams.query.pagination.limit
+    projection = build_projection(collection.name, qparams)
+    seek = decode_page_token(qparams.query.pagination.current_page) if qparams.query.pagination.current_page else None
+    if not query:
+        # The estimated count only reads the collection metadata, so there is
+        # nothing to share between both queries: run them side by side
+        if seek is not None:
+            documents = get_documents_after(collection, query, seek, limit, projection)
+        else:
+            documents = get_documents(collection, query, skip, limit, projection)
+        count, docs = await asyncio.gather(get_count(collection, query), documents, return_exceptions=True)
+        return await _complete_count(collection, query, count, docs)
+
+    try:
+        return await _aggregate_count_and_documents(collection, [{"$match": query}], qparams, projection, granularity)
+    except ExecutionTimeout:
+        # Counting all the matches did not fit in the budget: return the page,
+        # fetched on its own in the time left for the fallback queries
+        budget.mark_partial("count and documents on {}".format(collection.name))
+        if seek is not None:
+            cursor = collection.find({"$and": [query, seek]}, projection).sort("_id", 1).limit(limit)
+        else:
+            cursor = collection.find(query, projection).sort("_id", 1).skip(skip).limit(limit)
+        docs = await fetch_documents(cursor.max_time_ms(budget.grace_ms()))
+        return PartialCount(len(docs)), docs
+
+
+async def _complete_count(collection: AsyncIOMotorCollection, query: dict, count, docs) -> Tuple[int, List[dict]]:
+    # Results of a gather(count, documents) run with return_exceptions=True
+    if isinstance(docs, BaseException):
+        raise docs
+    if isinstance(count, ExecutionTimeout):
+        count = await get_partial_count(collection, query)
+        return PartialCount(max(count, len(docs))), docs
+    elif isinstance(count, BaseException):
+        raise count
+    return count, docs
+
+
+async def get_pipeline_count_and_documents(collection: AsyncIOMotorCollection,
+                                           pipeline: List[dict],
+                                           qparams: RequestParams,
+                                           projection: Optional[dict] = None,
+                                           granularity: Optional[Granularity] = None) -> Tuple[int, List[dict]]:
+    collection = with_collection_options(collection)
+    pipeline = await deferred.resolve(pipeline)
+    if granularity is None:
+        granularity = qparams.returned_granularity()
+    start = time.monotonic()
+    try:
+        return await _aggregate_count_and_documents(collection, pipeline, qparams, projection, granularity)
+    except ExecutionTimeout:
+        budget.mark_partial("pipeline on {}".format(collection.name))
+        if granularity == Granularity.BOOLEAN:
+            return 0, []
+    finally:
+        # Only the first $match of a pipeline can use an index
+        if advisor.is_enabled() and pipeline and "$match" in pipeline[0]:
+            advisor.record(collection.name, pipeline[0]["$match"], (time.monotonic() - start) * 1000)
+    # At least tell whether there is a match
+    try:
+        probe = pipeline + [{"$limit": 1}, {"$project": {"_id": 1}}]
+        docs = await collection.aggregate(probe, maxTimeMS=budget.grace_ms()).to_list(length=1)
+        return PartialCount(len(docs)), []
+    except ExecutionTimeout:
+        return PartialCount(0), []
+
+
+async def _aggregate_count_and_documents(collection: AsyncIOMotorCollection,
+                                         pipeline: List[dict],
+                                         qparams: RequestParams,
+                                         projection: Optional[dict],
+                                         granularity: Granularity) -> Tuple[int, List[dict]]:
+    LOG.debug("FINAL PIPELINE: {}".format(pipeline))
+    # Only the first $match of a pipeline can use an index
+    hint = selectivity.choose_index(collection.name, pipeline[0].get("$match")) if pipeline else None
+    if granularity == Granularity.BOOLEAN:
+        pipeline = pipeline + [{"$limit": 1}, {"$project": {"_id": 1}}]
+        explain.record(collection, "aggregate", pipeline=pipeline, cursor={}, hint=hint)
+        docs = await collection.aggregate(pipeline, maxTimeMS=budget.remaining_ms(), **hint_option(hint)).to_list(length=1)
+        return int(len(docs) > 0), []
+    elif granularity == Granularity.COUNT:
+        pipeline = pipeline + [{"$count": "total"}]
+        explain.record(collection, "aggregate", pipeline=pipeline, cursor={}, hint=hint)
+        results = await collection.aggregate(pipeline, maxTimeMS=budget.remaining_ms(), **hint_option(hint)).to_list(length=1)
+        return results[0]["total"] if results else 0, []
+
+    # Evaluate the pipeline once and split the matches in two branches:
+    # the total number of results and the requested page. Only the page is
+    # sorted, and with its limit, only the documents up to the page are kept
+    page = []
+    token = qparams.query.pagination.current_page
+    if token:
+        page.append({"$match": decode_page_token(token)})
+    page.append({"$sort": {"_id": 1}})
+    # The token takes precedence over skip
+    if qparams.query.pagination.skip and not token:
+        page.append({"$skip": qparams.query.pagination.skip})
+    if qparams.query.pagination.limit:
+        page.append({"$limit": qparams.query.pagination.limit})
+    if projection:
+        page.append({"$project": projection})
+    pipeline = pipeline + [
+        {"$facet": {
+            "count": [{"$count": "total"}],
+            "documents": page
+        }}
+    ]
+    explain.record(collection, "aggregate", pipeline=pipeline, cursor={}, allowDiskUse=True, hint=hint)
+    results = await collection.aggregate(pipeline, maxTimeMS=budget.remaining_ms(), allowDiskUse=True,
+                                         **hint_option(hint)).to_list(length=1)
+    count = results[0]["count"][0]["total"] if results[0]["count"] else 0
+    return count, results[0]["documents"]
+
+
+async def get_count_and_documents_by_ids(collection: AsyncIOMotorCollection,
+                                         query: dict,
+                                         id_field: str,
+                                         ids: List[str],
+                                         qparams: RequestParams,
+                                         granularity: Optional[Granularity] = None) -> Tuple[int, List[dict]]:
+    """Looks up a list of entries by id, with one $in query, and returns them in the order of the ids."""
+    if len(ids) <= 1:
+        if ids:
+            query = {"$and": [query, {id_field: ids[0]}]} if query else {id_field: ids[0]}
+        return await get_count_and_documents(collection, query, qparams, granularity)
+
+    collection = with_collection_options(collection)
+    query, semijoin = await deferred.resolve_semijoin(query, conf.semijoin_chunk_size)
+    if semijoin is not None:
+        # Only the values held by the requested entries can match
+        field, values = semijoin
+        explain.record(collection, "distinct", key=field, query={id_field: {"$in": ids}})
+        held = set(await collection.distinct(field, {id_field: {"$in": ids}}))
+        values = [value for value in values if value in held]
+        query = _query_in(query, field, values)
+    ids_query = {id_field: {"$in": ids}}
+    if granularity is None:
+        granularity = qparams.returned_granularity()
+    if granularity != Granularity.RECORD:
+        return await get_count_and_documents_in(collection, query, id_field, ids, qparams, granularity)
+
+    # The pages are taken from the list of ids, not from the matching documents
+    if qparams.query.pagination.current_page:
+        raise web.HTTPBadRequest(reason="A list of ids is paged with skip and limit")
+    skip = qparams.query.pagination.skip
+    limit = qparams.query.pagination.limit
+    page_ids = ids[skip:skip + limit] if limit else ids[skip:]
+    page_query = {id_field: {"$in": page_ids}}
+
+    # The id is needed to sort the documents, even if it was not requested
+    projection = build_projection(collection.name, qparams)
+    added_id_field = projection is not None and projection.get(id_field, 0) == 0 and any(projection.values())
+    if added_id_field:
+        projection = {**projection, id_field: 1}
+
+    page_query = {"$and": [query, page_query]} if query else page_query
+    count, docs = await asyncio.gather(
+        get_count_in(collection, query, id_field, ids),
+        get_documents(collection, page_query, 0, 0, projection),
+        return_exceptions=True
+    )
+    count, docs = await _complete_count(collection, {"$and": [query, ids_query]} if query else ids_query, count, docs)
+
+    position = {entry_id: i for i, entry_id in enumerate(page_ids)}
+    docs.sort(key=lambda doc: position.get(doc.get(id_field), len(position)))
+    if added_id_field:
+        for doc in docs:
+            doc.pop(id_field, None)
+    return count, docs
+
+
+def _chunks(values, size: int) -> list:
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def _query_in(query: dict, field: str, values) -> dict:
+    return {"$and": [query, {field: {"$in": values}}]} if query else {field: {"$in": values}}
+
+
+def chunked_queries(query: dict, field: str, values) -> List[dict]:
+    """The query on each chunk of semijoin_chunk_size of the values of the field."""
+    return [_query_in(query, field, chunk) for chunk in _chunks(values, conf.semijoin_chunk_size)]
+
+
+async def _gather_chunks(coroutines) -> list:
+    # The chunks share the connection pool with the other requests: only a few run at a time
+    semaphore = asyncio.Semaphore(conf.semijoin_concurrency)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+    return await asyncio.gather(*(run(c) for c in coroutines), return_exceptions=True)
+
+
+async def get_count_in(collection: AsyncIOMotorCollection, query: dict, field: str, values) -> int:
+    """
+    Counts the documents whose field is one of the values, a chunk of values at a time.
+    The field must have a single value per document, or a document would be counted once per chunk.
+    """
+    chunk_size = conf.semijoin_chunk_size
+    if len(values) <= chunk_size:
+        return await get_count(collection, _query_in(query, field, values))
+    counts = await _gather_chunks(get_count(collection, _query_in(query, field, chunk))
+                                  for chunk in _chunks(values, chunk_size))
+    for count in counts:
+        if isinstance(count, BaseException) and not isinstance(count, ExecutionTimeout):
+            raise count
+    total = sum(count for count in counts if not isinstance(count, BaseException))
+    if len(counts) > sum(1 for count in counts if not isinstance(count, BaseException)):
+        budget.mark_partial("count of {} chunks on {}".format(len(counts), collection.name))
+        return PartialCount(total)
+    return total
+
+
+async def get_ids_in(collection: AsyncIOMotorCollection, query: dict, field: str, values) -> list:
+    """
+    _id of the documents whose field holds one of the values, a chunk of values at a time: for the fields
+    holding several values per document, which would be counted once per chunk by get_count_in.
+    """
+    object_ids = set()
+
+    async def read_ids(chunk_query: dict):
+        explain.record(collection, "find", filter=chunk_query, projection={"_id": 1})
+        cursor = collection.find(chunk_query, {"_id": 1}).batch_size(conf.semijoin_chunk_size)
+        # The ids are added as the batches arrive, the chunks don't hold a list of them
+        async for doc in cursor.max_time_ms(budget.remaining_ms()):
+            object_ids.add(doc["_id"])
+
+    for result in await _gather_chunks(read_ids(q) for q in chunked_queries(query, field, values)):
+        if isinstance(result, ExecutionTimeout):
+            budget.mark_partial("semi-join on {}".format(collection.name))
+        elif isinstance(result, BaseException):
+            raise result
+    return sorted(object_ids)
+
+
+async def get_count_and_documents_in(collection: AsyncIOMotorCollection,
+                                     query: dict,
+                                     field: str,
+                                     values,
+                                     qparams: RequestParams,
+                                     granularity: Optional[Granularity] = None) -> Tuple[int, List[dict]]:
+    """
+    Semi-join on a list of values (e.g. the members of a dataset): the documents whose field is one of them.
+    Long lists are split in chunks of semijoin_chunk_size values, queried concurrently, so that no query gets
+    close to the 16 MB limit of a BSON document. The counts of the chunks are added together and their
+    documents merged by _id, the order of the pages.
+    """
+    query = await deferred.resolve(query)
+    chunk_size = conf.semijoin_chunk_size
+    if len(values) <= chunk_size:
+        return await get_count_and_documents(collection, _query_in(query, field, values), qparams, granularity)
+
+    collection = with_collection_options(collection)
+    if granularity is None:
+        granularity = qparams.returned_granularity()
+    chunks = _chunks(values, chunk_size)
+    LOG.debug("Semi-join on {} {} values, in {} chunks".format(len(values), field, len(chunks)))
+
+    if granularity == Granularity.BOOLEAN:
+        # Stop at the first chunk with a match
+        for chunk in chunks:
+            try:
+                if await get_existence(collection, _query_in(query, field, chunk)):
+                    return 1, []
+            except ExecutionTimeout:
+                budget.mark_partial("existence on {}".format(collection.name))
+                break
+        return 0, []
+    elif granularity == Granularity.COUNT:
+        return await get_count_in(collection, query, field, values), []
+
+    # Each chunk returns its first documents by _id, the page is taken from their merge
+    skip = qparams.query.pagination.skip
+    limit = qparams.query.pagination.limit
+    projection = build_projection(collection.name, qparams)
+    if qparams.query.pagination.current_page:
+        seek = decode_page_token(qparams.query.pagination.current_page)
+        skip = 0
+        fetches = (get_documents_after(collection, _query_in(query, field, chunk), seek, limit, projection)
+                   for chunk in chunks)
+    else:
+        fetches = (get_documents(collection, _query_in(query, field, chunk), 0, skip + limit if limit else 0, projection)
+                   for chunk in chunks)
+    count, chunk_docs = await asyncio.gather(
+        get_count_in(collection, query, field, values),
+        _gather_chunks(fetches),
+        return_exceptions=True
+    )
+    if isinstance(chunk_docs, BaseException):
+        raise chunk_docs
+    for docs in chunk_docs:
+        if isinstance(docs, BaseException):
+            raise docs
+    docs = list(heapq.merge(*chunk_docs, key=lambda doc: doc["_id"]))
+    docs = docs[skip:skip + limit] if limit else docs[skip:]
+    if isinstance(count, ExecutionTimeout):
+        budget.mark_partial("count on {}".format(collection.name))
+        count = PartialCount(len(docs))
+    elif isinstance(count, BaseException):
+        raise count
+    return count, docs
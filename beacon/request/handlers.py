@@ -1,9 +1,16 @@
+import asyncio
 import json
 import logging
+import re
+from typing import Optional
+
 from aiohttp import web
 from aiohttp.web_request import Request
 from bson import json_util
+from pydantic import ValidationError
+from pymongo.errors import ExecutionTimeout
 from beacon import conf
+from beacon.db import budget, explain, plans
 
 from beacon.request import ontologies
 from beacon.request.model import Granularity, RequestParams
@@ -14,11 +21,43 @@ from beacon.response.build_response import (
     build_beacon_count_response,
     build_filtering_terms_response,
 )
+from beacon.utils.auth import check_admin
 from beacon.utils.stream import json_stream
 
 LOG = logging.getLogger(__name__)
 
 
+# The entry endpoints, e.g. /api/individuals/ and /api/individuals/{id}/, are the ones looking up a list of ids
+ENTRY_ROUTE = re.compile(r'^/api/[a-z_]+/(\{id\}/)?$')
+
+
+def split_entry_ids(entry_id: Optional[str], qparams: RequestParams, route: str) -> Optional[str]:
+    if ENTRY_ROUTE.match(route):
+        # A comma-separated list of ids in the path is looked up like the ids of the request
+        if entry_id is not None and ',' in entry_id:
+            qparams.query.ids = entry_id.split(',') + qparams.query.ids
+            return None
+        return entry_id
+    # The entries related to another one, e.g. /api/individuals/{id}/biosamples/, are looked up for a single id
+    if (entry_id is not None and ',' in entry_id) or qparams.query.ids:
+        raise web.HTTPBadRequest(reason="A list of ids can't be given to {}".format(route))
+    return entry_id
+
+
+async def collection_response(db_fn, entry_id: Optional[str], qparams: RequestParams, route: str) -> dict:
+    entry_id = split_entry_ids(entry_id, qparams, route)
+    budget.start(route, Granularity.RECORD)
+
+    # Get response
+    entity_schema, count, records = await db_fn(entry_id, qparams)
+    response_converted = (
+        [r for r in records] if records else []
+    )
+    return build_beacon_collection_response(
+        response_converted, count, qparams, lambda x, y: x, entity_schema
+    )
+
+
 def collection_handler(db_fn, request=None):
     async def wrapper(request: Request):
         # Get params
@@ -26,19 +65,38 @@ def collection_handler(db_fn, request=None):
         qparams = RequestParams(**json_body).from_request(request)
         entry_id = request.match_info["id"] if "id" in request.match_info else None
 
-        # Get response
-        entity_schema, count, records = db_fn(entry_id, qparams)
-        response_converted = (
-            [r for r in records] if records else []
-        )
-        response = build_beacon_collection_response(
-            response_converted, count, qparams, lambda x, y: x, entity_schema
-        )
-        return await json_stream(request, response)
+        response = await collection_response(db_fn, entry_id, qparams, request.match_info.route.resource.canonical)
+        return await json_stream(request, response, partial=budget.is_partial())
 
+    # Used by the explain and batch routes to run an endpoint without its handler
+    wrapper.db_fn = db_fn
+    wrapper.build_response = collection_response
     return wrapper
 
 
+async def generic_response(db_fn, entry_id: Optional[str], qparams: RequestParams, route: str) -> dict:
+    entry_id = split_entry_ids(entry_id, qparams, route)
+    granularity = qparams.returned_granularity()
+    budget.start(route, granularity)
+
+    # Get response
+    entity_schema, count, records = await db_fn(entry_id, qparams)
+    response_converted = records
+
+    # The db functions already honour the returned granularity, so a
+    # boolean answer does not carry a real count nor any record
+    if granularity == Granularity.BOOLEAN:
+        if not count and budget.is_partial():
+            # No match was found in time, which does not tell whether there is one
+            raise web.HTTPGatewayTimeout(
+                reason="The query time budget ran out before a match was found, whether one exists is unknown")
+        return build_beacon_boolean_response(response_converted, count, qparams, lambda x, y: x, entity_schema)
+    elif granularity == Granularity.COUNT:
+        return build_beacon_count_response(response_converted, count, qparams, lambda x, y: x, entity_schema)
+    else:
+        return build_beacon_resultset_response(response_converted, count, qparams, lambda x, y: x, entity_schema)
+
+
 def generic_handler(db_fn, request=None):
     async def wrapper(request: Request):
         # Get params
@@ -46,33 +104,13 @@ def generic_handler(db_fn, request=None):
         qparams = RequestParams(**json_body).from_request(request)
         entry_id = request.match_info.get('id', None)
 
-        # Get response
-        entity_schema, count, records = db_fn(entry_id, qparams)
-        response_converted = records
-
-        response = None
-
-        if qparams.query.requested_granularity == Granularity.BOOLEAN:
-            response = build_beacon_boolean_response(response_converted, count, qparams, lambda x, y: x, entity_schema)
-        
-        elif qparams.query.requested_granularity == Granularity.COUNT:
-            if conf.max_beacon_granularity == Granularity.BOOLEAN:
-                response = build_beacon_boolean_response(response_converted, count, qparams, lambda x, y: x, entity_schema)
-            else:
-                response = build_beacon_count_response(response_converted, count, qparams, lambda x, y: x, entity_schema)
-        
-        # qparams.query.requested_granularity == Granularity.RECORD:
-        else:
-
-            if conf.max_beacon_granularity == Granularity.BOOLEAN:
-                response = build_beacon_boolean_response(response_converted, count, qparams, lambda x, y: x, entity_schema)
-            elif conf.max_beacon_granularity == Granularity.COUNT:
-                response = build_beacon_count_response(response_converted, count, qparams, lambda x, y: x, entity_schema)
-            else:
-                response = build_beacon_resultset_response(response_converted, count, qparams, lambda x, y: x, entity_schema)
-                
-        return await json_stream(request, response)
+        response = await generic_response(db_fn, entry_id, qparams, request.match_info.route.resource.canonical)
+        # The query time budget ran out: the response only has what was found in time
+        return await json_stream(request, response, partial=budget.is_partial())
 
+    # Used by the explain and batch routes to run an endpoint without its handler
+    wrapper.db_fn = db_fn
+    wrapper.build_response = generic_response
     return wrapper
 
 def filtering_terms_handler(db_fn, request=None):
@@ -83,9 +121,112 @@ def filtering_terms_handler(db_fn, request=None):
         entry_id = request.match_info.get('id', None)
 
         # Get response
-        _, _, records = db_fn(entry_id, qparams)
+        _, _, records = await db_fn(entry_id, qparams)
         resources = ontologies.get_resources()
         response = build_filtering_terms_response(records, resources, qparams)
         return await json_stream(request, response)
 
     return wrapper
+
+
+async def explain_handler(request: Request):
+    """Runs the db function of the endpoint under /api/explain/ and explains the queries it sent."""
+    check_admin(request)
+
+    # Resolve the entry endpoint, e.g. /api/explain/g_variants/ -> /api/g_variants/
+    path = '/api/' + request.match_info['path']
+    match_info = await request.app.router.resolve(request.clone(method='POST', rel_url=path))
+    db_fn = getattr(match_info.handler, 'db_fn', None)
+    if db_fn is None:
+        raise web.HTTPNotFound(reason="No entry endpoint at {}".format(path))
+
+    json_body = await request.json() if request.method == "POST" and request.has_body and request.can_read_body else {}
+    qparams = RequestParams(**json_body).from_request(request)
+    entry_id = split_entry_ids(match_info.get('id', None), qparams, match_info.route.resource.canonical)
+    granularity = qparams.returned_granularity()
+    budget.start(match_info.route.resource.canonical, granularity)
+
+    with explain.capture() as operations:
+        await db_fn(entry_id, qparams)
+    response = {
+        'endpoint': match_info.route.resource.canonical,
+        'granularity': granularity.value,
+        'operations': await explain.explain_operations(operations),
+        'planCache': plans.cache.stats(),
+    }
+    # The commands and plans contain ObjectIds, regexes, etc.
+    return await json_stream(request, json.loads(json_util.dumps(response)))
+
+
+async def batch_handler(request: Request):
+    """
+    Runs a list of queries, each one on any entry endpoint, e.g.
+    [{"endpoint": "individuals/", "body": {"query": {...}}}, {"endpoint": "biosamples/{id}/runs/"}, ...]
+    and returns one response per query, in the same order.
+    """
+    # A request can't be cloned once its body is read: keep one to resolve the endpoints
+    endpoint_request = request.clone(method='GET')
+    items = await request.json()
+    if not isinstance(items, list):
+        raise web.HTTPBadRequest(reason="The body of a batch must be a list of queries")
+    max_queries = conf.batch_max_queries
+    if len(items) > max_queries:
+        raise web.HTTPBadRequest(reason="A batch can have at most {} queries".format(max_queries))
+
+    # Identical queries are run once
+    runs = {}
+    semaphore = asyncio.Semaphore(conf.batch_concurrency)
+    keys = []
+    for item in items:
+        key = json.dumps(item, sort_keys=True, default=str)
+        if isinstance(item, dict) and isinstance(item.get('endpoint'), str):
+            key = json.dumps([_batch_path(item['endpoint']), item.get('body', {})], sort_keys=True, default=str)
+        if key not in runs:
+            runs[key] = asyncio.ensure_future(_run_batch_query(endpoint_request, item, semaphore))
+        keys.append(key)
+    LOG.debug("Batch of {} queries, {} distinct".format(len(items), len(runs)))
+
+    results = dict(zip(runs.keys(), await asyncio.gather(*runs.values())))
+    return await json_stream(request, {'responses': [
+        # A query run once for several items is reported under the endpoint of each
+        dict(results[key], endpoint=item.get('endpoint') if isinstance(item, dict) else None)
+        for key, item in zip(keys, items)
+    ]})
+
+
+def _batch_path(endpoint: str) -> str:
+    # The entry endpoint of a batch query, e.g. individuals/ -> /api/individuals/
+    return '/api/' + endpoint.lstrip('/').removeprefix('api/')
+
+
+async def _run_batch_query(endpoint_request: Request, item, semaphore: asyncio.Semaphore) -> dict:
+    if not isinstance(item, dict) or not isinstance(item.get('endpoint'), str):
+        return {'endpoint': None, 'status': 400, 'error': "A batch query needs an endpoint"}
+    endpoint = item['endpoint']
+    try:
+        path = _batch_path(endpoint)
+        sub_request = endpoint_request.clone(rel_url=path)
+        match_info = await endpoint_request.app.router.resolve(sub_request)
+        build_response = getattr(match_info.handler, 'build_response', None)
+        if build_response is None:
+            raise web.HTTPNotFound(reason="No entry endpoint at {}".format(path))
+        body = item.get('body', {})
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(reason="The body of a batch query must be an object")
+        # The query string of the endpoint is read as for a GET, the body on top of it
+        qparams = RequestParams(**body).from_request(sub_request)
+        async with semaphore:
+            response = await build_response(
+                match_info.handler.db_fn, match_info.get('id', None), qparams, match_info.route.resource.canonical)
+        return {'endpoint': endpoint, 'status': 206 if budget.is_partial() else 200, 'response': response}
+    except web.HTTPException as e:
+        return {'endpoint': endpoint, 'status': e.status, 'error': e.reason}
+    # A query failing must not fail the others: each one reports its own error
+    except (ValidationError, TypeError, ValueError, KeyError) as e:
+        # e.g. a body that is not a request, ?skip=abc or an unknown request parameter (?foo=bar)
+        return {'endpoint': endpoint, 'status': 400, 'error': str(e)}
+    except ExecutionTimeout as e:
+        return {'endpoint': endpoint, 'status': 504, 'error': str(e)}
+    except Exception as e:
+        LOG.error("Batch query on {} failed: {}".format(endpoint, e))
+        return {'endpoint': endpoint, 'status': 500, 'error': str(e)}
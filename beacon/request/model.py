@@ -65,6 +65,8 @@ class CustomFilter(CamelModel):
 class Pagination(CamelModel):
     skip: int = 0
     limit: int = 10
+    # Opaque token returned as `nextPage` by a previous response, takes precedence over skip
+    current_page: Optional[str] = None
 
 
 class RequestMeta(CamelModel):
@@ -77,6 +79,8 @@ class RequestQuery(CamelModel):
     include_resultset_responses: IncludeResultsetResponses = IncludeResultsetResponses.HIT
     pagination: Pagination = Pagination()
     request_parameters: dict = {}
+    fields: List[str] = []
+    ids: List[str] = []
     test_mode: bool = False
     requested_granularity: Granularity = Granularity(conf.default_beacon_granularity)
 
@@ -94,12 +98,28 @@ class RequestParams(CamelModel):
                     self.query.pagination.skip = int(v)
                 elif k == "limit":
                     self.query.pagination.limit = int(v)
+                elif k == "currentPage":
+                    self.query.pagination.current_page = v
+                elif k == "fields":
+                    self.query.fields = v.split(',')
+                elif k == "id":
+                    self.query.ids = v.split(',')
                 elif k == "includeResultsetResponses":
                     self.query.include_resultset_responses = IncludeResultsetResponses(v)
                 else:
                     self.query.request_parameters[k] = v
         return self
 
+    def returned_granularity(self) -> Granularity:
+        # The requested granularity is capped by the one allowed by the beacon
+        granularity = self.query.requested_granularity
+        if granularity == Granularity.BOOLEAN or conf.max_beacon_granularity == Granularity.BOOLEAN:
+            return Granularity.BOOLEAN
+        elif granularity == Granularity.COUNT or conf.max_beacon_granularity == Granularity.COUNT:
+            return Granularity.COUNT
+        else:
+            return Granularity.RECORD
+
     def summary(self):
         return {
             "apiVersion": self.meta.api_version,
@@ -107,7 +127,7 @@ class RequestParams(CamelModel):
             "filters": self.query.filters,
             "requestParameters": self.query.request_parameters,
             "includeResultsetResponses": self.query.include_resultset_responses,
-            "pagination": self.query.pagination.dict(),
+            "pagination": self.query.pagination.dict(by_alias=True, exclude_none=True),
             "requestedGranularity": self.query.requested_granularity,
             "testMode": self.query.test_mode
         }
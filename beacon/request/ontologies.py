@@ -20,41 +20,45 @@ LOG = logging.getLogger(__name__)
 ONTOLOGIES = {"NCIT":"hola"}
 ONTOLOGY_REGEX = re.compile(r"([_A-Za-z]+):(\w+)")
 
-def find_all_ontologies_used() -> Set[str]:
+async def find_all_ontologies_used() -> Set[str]:
     ontologies = set()
     for c_name in ["analyses", "biosamples", "cohorts", "genomicVariations", "datasets", "individuals", "runs"]:
-        ontologies_aux = find_ontologies_used(c_name)
+        ontologies_aux = await find_ontologies_used(c_name)
         ontologies = ontologies.union(ontologies_aux)
     return ontologies
 
 
-def find_all_ontology_terms_used() -> Set[str]:
+async def find_all_ontology_terms_used() -> Set[str]:
     ontologies = set()
     for c_name in ["analyses", "biosamples", "cohorts", "genomicVariations", "datasets", "individuals", "runs"]:
-        ontologies_aux = find_ontology_terms_used(c_name)
+        ontologies_aux = await find_ontology_terms_used(c_name)
         ontologies = ontologies.union(ontologies_aux)
     return ontologies
 
 
-def find_ontologies_used(collection_name: str) -> Set[str]:
+async def find_ontologies_used(collection_name: str) -> Set[str]:
     ontologies = set()
-    count = client.beacon.get_collection(collection_name).estimated_document_count()
+    count = await client.beacon.get_collection(collection_name).estimated_document_count()
     xs = client.beacon.get_collection(collection_name).find()
-    for r in tqdm(xs, total=count):
-        matches = ONTOLOGY_REGEX.findall(str(r))
-        for match0, _ in matches:
-            ontologies.add(match0)
+    with tqdm(total=count) as progress:
+        async for r in xs:
+            progress.update()
+            matches = ONTOLOGY_REGEX.findall(str(r))
+            for match0, _ in matches:
+                ontologies.add(match0)
     return ontologies
 
 
-def find_ontology_terms_used(collection_name: str) -> Set[str]:
+async def find_ontology_terms_used(collection_name: str) -> Set[str]:
     terms = set()
-    count = client.beacon.get_collection(collection_name).estimated_document_count()
+    count = await client.beacon.get_collection(collection_name).estimated_document_count()
     xs = client.beacon.get_collection(collection_name).find()
-    for r in tqdm(xs, total=count):
-        matches = ONTOLOGY_REGEX.findall(str(r))
-        for match in matches:
-            terms.add(match)
+    with tqdm(total=count) as progress:
+        async for r in xs:
+            progress.update()
+            matches = ONTOLOGY_REGEX.findall(str(r))
+            for match in matches:
+                terms.add(match)
     return terms
 
 
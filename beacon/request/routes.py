@@ -1,7 +1,7 @@
 from aiohttp import web
 
 from beacon.db import analyses, biosamples, cohorts, datasets, g_variants, individuals, runs, filtering_terms
-from beacon.request.handlers import collection_handler, generic_handler, filtering_terms_handler
+from beacon.request.handlers import collection_handler, generic_handler, filtering_terms_handler, explain_handler, batch_handler
 from beacon.response import framework, info, service_info
 
 routes = [
@@ -114,4 +114,13 @@ routes = [
     web.post('/api/runs/{id}/', generic_handler(db_fn=runs.get_run_with_id)),
     web.post('/api/runs/{id}/g_variants/', generic_handler(db_fn=runs.get_variants_of_run)),
     web.post('/api/runs/{id}/analyses/', generic_handler(db_fn=runs.get_analyses_of_run)),
+
+    web.post('/api/batch/', batch_handler),
+
+    ########################################
+    # DEBUG (admin only)
+    ########################################
+
+    web.get('/api/explain/{path:.+}', explain_handler),
+    web.post('/api/explain/{path:.+}', explain_handler),
 ]
@@ -2,6 +2,7 @@ from typing import Optional
 
 from beacon import conf
 from beacon.db.schemas import DefaultSchemas
+from beacon.db.utils import ApproximateCount, PartialCount, encode_page_token
 from beacon.request import RequestParams
 from beacon.request.model import Granularity
 
@@ -23,7 +24,8 @@ def build_meta(qparams: RequestParams, entity_schema: Optional[DefaultSchemas],
 
 
 def build_response_summary(exists, num_total_results):
-    if num_total_results is None:
+    # A partial count (the query time budget ran out) is only a lower bound
+    if num_total_results is None or isinstance(num_total_results, PartialCount):
         return {
             'exists': exists
         }
@@ -72,8 +74,24 @@ def build_beacon_resultset_response(data,
         },
         'beaconHandovers': conf.beacon_handovers,
     }
+    pagination = build_pagination(data, qparams)
+    if pagination:
+        beacon_response['info'] = {'pagination': pagination}
     return beacon_response
 
+
+def build_pagination(data, qparams: RequestParams):
+    """Builds the page tokens of a resultset, to request the next page without skipping documents"""
+
+    pagination = {}
+    if qparams.query.pagination.current_page:
+        pagination['currentPage'] = qparams.query.pagination.current_page
+    limit = qparams.query.pagination.limit
+    # A list of ids is paged with skip and limit
+    if limit and len(data) == limit and len(qparams.query.ids) <= 1:
+        pagination['nextPage'] = encode_page_token(data[-1])
+    return pagination
+
 ########################################
 # Count Response
 ########################################
@@ -93,6 +111,13 @@ def build_beacon_count_response(data,
         # TODO: 'extendedInfo': build_extended_info(),
         'beaconHandovers': conf.beacon_handovers,
     }
+    if isinstance(num_total_results, ApproximateCount):
+        beacon_response['info'] = {
+            'approximateCount': {
+                'errorBound': num_total_results.error_bound,
+                'confidenceLevel': 0.95
+            }
+        }
     return beacon_response
 
 ########################################
@@ -1,7 +1,10 @@
+import hmac
 import logging
 
 from aiohttp import ClientSession, web
+from aiohttp.web_request import Request
 
+from beacon import conf
 from beacon.db.datasets import filter_public_datasets
 from ..conf import permissions_url
 
@@ -12,7 +15,7 @@ async def resolve_token(token, requested_datasets_ids):
     # If the user is not authenticated (ie no token)
     # we pass (requested_datasets, False) to the database function: it will filter out the datasets list, with the public ones
     if token is None:
-        public_datasets = [ d["name"] for d in filter_public_datasets(requested_datasets_ids) ]
+        public_datasets = [ d["name"] for d in await filter_public_datasets(requested_datasets_ids) ]
         return public_datasets, False
 
     # Otherwise, we have a token and resolve the datasets with the permissions server
@@ -34,3 +37,17 @@ async def resolve_token(token, requested_datasets_ids):
 
             authorized_datasets = await resp.json()
             return authorized_datasets, True
+
+
+def check_admin(request: Request):
+    """Only lets through the requests bearing one of the admin_tokens of the configuration."""
+    admin_tokens = conf.admin_tokens
+    if not admin_tokens:
+        # No admin: the admin routes are disabled
+        raise web.HTTPNotFound()
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Bearer '):
+        raise web.HTTPUnauthorized(reason="Admin token required")
+    token = authorization[len('Bearer '):]
+    if not any(hmac.compare_digest(token, admin_token) for admin_token in admin_tokens):
+        raise web.HTTPForbidden(reason="Invalid admin token")
@@ -14,6 +14,140 @@ uri = 'https://beacon-giab-test.ega-archive.org'
 default_beacon_granularity = "record"
 max_beacon_granularity = "record"
 
+#
+# Approximate counts (only used for the count granularity)
+# Collections bigger than the threshold estimate their counts from a random sample
+#
+approximate_count_enabled = False
+approximate_count_threshold = 1000000
+approximate_count_sample_size = 10000
+
+#
+# Linkage index
+# In-memory adjacency between individuals, biosamples, runs, analyses and variants,
+# built at startup and rebuilt when entries are inserted, used by the unfiltered cross-entity routes
+# (e.g. /individuals/{id}/g_variants)
+#
+linkage_index_enabled = False
+linkage_index_refresh_seconds = 300
+
+#
+# Membership cache
+# Members (individual and biosample ids) of the datasets and cohorts kept in memory, 0 to disable
+#
+membership_cache_size = 1024  # Datasets and cohorts
+membership_cache_ttl = 3600  # Seconds
+
+#
+# Ontology index
+# Documents containing each ontology term, as compressed bitmaps, built at startup and refreshed
+# with the documents inserted since, used to evaluate the ontology filters instead of $text
+#
+ontology_index_enabled = False
+ontology_index_refresh_seconds = 300
+ontology_index_max_ids = 100000  # Above it, the $text search is used
+
+#
+# Bitmap engine
+# The count and boolean requests made only of filters are answered by intersecting the bitmaps
+# of the documents matching each filter, cached per filter (needs the ontology index)
+#
+bitmap_engine_enabled = False
+bitmap_cache_size = 4096  # Filters
+
+#
+# Trigram index
+# Trigrams of the string fields used in LIKE filters ('%' in the value), built at startup and
+# refreshed with the documents inserted since, used to narrow the documents down before the
+# regex of the filter is evaluated
+#
+trigram_index_enabled = False
+trigram_index_refresh_seconds = 300
+trigram_index_max_candidates = 10000  # Above it, the regex alone is used
+trigram_index_fields = {
+    'biosamples': ['biosampleStatus.label', 'sampleOriginType.label'],
+    'individuals': [
+        'diseases.diseaseCode.label',
+        'ethnicity.label',
+        'geographicOrigin.label',
+        'interventionsOrProcedures.procedureCode.label',
+        'measures.assayCode.label',
+        'sex.label',
+    ],
+    'runs': ['librarySource.label', 'platformModel.label'],
+}
+
+#
+# Measures index
+# Values of the numeric measures of the individuals, sorted per assay code, built at startup and
+# refreshed with the individuals inserted since, used by the numeric filters
+# (e.g. {"id": "LOINC:35925-4", "operator": ">", "value": "25"})
+#
+measures_index_enabled = False
+measures_index_refresh_seconds = 300
+measures_index_max_ids = 100000  # Above it, the $elemMatch is used
+
+#
+# Index hints
+# When several indexes can serve a query, the index of its most selective clause is hinted,
+# as estimated from the counts of the filtering terms loaded at startup
+#
+selectivity_hint_enabled = True
+
+#
+# Query plan cache
+# Mongo queries compiled from the filters and request parameters, 0 to disable
+#
+plan_cache_size = 1024
+
+#
+# Semi-joins on long lists of ids (e.g. the members of a dataset)
+# The lists are split in chunks queried concurrently, instead of a single $in
+#
+semijoin_chunk_size = 10000  # Ids per query
+semijoin_concurrency = 4  # Chunks queried at the same time
+
+#
+# Negated filters
+# Evaluated as the complement of the positive filter, which can use an index, unless more documents match it
+#
+negation_complement_max_ids = 100000
+
+#
+# Query time budgets (in milliseconds), per granularity and optionally per route
+# A request running out of time gets what was found so far, with a 206 status,
+# or a 504 for a boolean request that found no match in time
+#
+query_time_budget_ms = {
+    'boolean': 5000,
+    'count': 10000,
+    'record': 10000,
+}
+# e.g. {'/api/g_variants/': {'count': 20000}, '/api/individuals/{id}/g_variants/': {'record': 15000}}
+query_time_budget_routes = {}
+# Time given to the fallback queries (existence probe, first page) once the budget is spent
+query_time_budget_grace_ms = 1000
+
+#
+# Index advisor
+# Records the shape of the queries and proposes indexes for them: python -m beacon.db.advisor
+#
+index_advisor_enabled = False
+index_advisor_collection = 'queryShapes'
+index_advisor_flush_seconds = 60
+
+#
+# Batch queries (/api/batch/)
+#
+batch_max_queries = 100  # Queries per batch
+batch_concurrency = 10  # Queries of a batch run at the same time
+
+#
+# Admin
+# Bearer tokens accepted by the admin routes (e.g. /api/explain/g_variants/), disabled when empty
+#
+admin_tokens = []
+
 #
 #  Organization info
 #
@@ -81,7 +215,20 @@ database_password = 'example'
 database_name = 'beacon'
 database_auth_source = 'admin'
 # database_schema = 'public' # comma-separated list of schemas
-# database_app_name = 'beacon-appname' # Useful to track connections
+database_app_name = ''  # Useful to track connections, e.g. 'beacon-appname'
+database_replica_set = ''  # e.g. 'rs0', database_host can then list the members: 'mongo1,mongo2,mongo3'
+database_min_pool_size = 0
+database_max_pool_size = 100
+database_server_selection_timeout_ms = 30000
+database_connect_timeout_ms = 20000
+# The beacon only reads: primary, primaryPreferred, secondary, secondaryPreferred or nearest
+database_read_preference = 'primary'
+database_read_concern = 'local'  # local, available, majority
+# Wire compression, e.g. 'zstd,snappy' (needs the zstandard / python-snappy packages)
+database_compressors = ''
+# Per-collection read preference and read concern, e.g.
+# {'genomicVariations': {'read_preference': 'secondaryPreferred', 'read_concern': 'available'}}
+database_collection_options = {}
 
 #
 # Web server configuration
@@ -1,6 +1,6 @@
 import os.path
 import urllib.request
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import re
 from urllib.error import HTTPError
 
@@ -111,40 +111,59 @@ def get_ontology_term_count(collection_name: str, term: str) -> int:
 
 def find_ontology_terms_used(collection_name: str) -> List[Dict]:
     terms = []
-    terms_ids = set()
+    # Every path each term is found at, in the order they are found
+    terms_paths: Dict[str, Dict[str, None]] = {}
+    terms_ontologies = dict()
     ontologies = dict()
     count = client.beacon.get_collection(collection_name).estimated_document_count()
     xs = client.beacon.get_collection(collection_name).find()
     for r in tqdm(xs, total=count):
-        matches = ONTOLOGY_REGEX.findall(str(r))
-        for ontology_id, term_id in matches:
-            term = ':'.join([ontology_id, term_id])
-            print(term, ontology_id)
-            if term not in terms_ids:
-                terms_ids.add(term)
-                if ontology_id not in ontologies:
-                    ontologies[ontology_id] = load_ontology(ontology_id)
-                if ontologies[ontology_id] is not None:
-                    terms.append({
-                        'type': get_ontology_name(ontologies[ontology_id]),
-                        'id': term,
-                        'label': get_ontology_term_label(ontologies[ontology_id], term),
-                        # TODO: Use conf.py -> beaconGranularity to not disclouse counts in the filtering terms
-                        'count': get_ontology_term_count(collection_name, term),
-                        'collection': collection_name,
-                    })
+        for path, value in get_string_values_of_document(r):
+            for ontology_id, term_id in ONTOLOGY_REGEX.findall(value):
+                term = ':'.join([ontology_id, term_id])
+                terms_paths.setdefault(term, {})[path] = None
+                terms_ontologies[term] = ontology_id
+    for term, paths in terms_paths.items():
+        ontology_id = terms_ontologies[term]
+        if ontology_id not in ontologies:
+            ontologies[ontology_id] = load_ontology(ontology_id)
+        if ontologies[ontology_id] is not None:
+            terms.append({
+                'type': get_ontology_name(ontologies[ontology_id]),
+                'id': term,
+                'label': get_ontology_term_label(ontologies[ontology_id], term),
+                # TODO: Use conf.py -> beaconGranularity to not disclouse counts in the filtering terms
+                'count': get_ontology_term_count(collection_name, term),
+                'collection': collection_name,
+                # Where the term is found, for the field catalog of the beacon
+                'paths': list(paths),
+                'valueType': 'string',
+            })
     return terms
 
 
+def get_string_values_of_document(document, prefix="") -> List[Tuple[str, str]]:
+    values = []
+    if isinstance(document, str):
+        values.append((prefix, document))
+    elif isinstance(document, list):
+        for elem in document:
+            values += get_string_values_of_document(elem, prefix)
+    elif isinstance(document, dict):
+        for key, value in document.items():
+            values += get_string_values_of_document(value, prefix + '.' + key if prefix else key)
+    return values
+
+
 def get_alphanumeric_term_count(collection_name: str, key: str) -> int:
     return len(client.beacon\
         .get_collection(collection_name)\
         .distinct(key))
 
 
-def get_properties_of_document(document, prefix="") -> List[str]:
+def get_properties_of_document(document, prefix="") -> List[Tuple[str, Optional[str]]]:
     properties = []
-    if document is None or isinstance(document, str) or isinstance(document, int):
+    if document is None or isinstance(document, str) or isinstance(document, (int, float)):
         return []
     elif isinstance(document, list):
         for elem in document:
@@ -154,11 +173,12 @@ def get_properties_of_document(document, prefix="") -> List[str]:
             if isinstance(value, ObjectId):
                 continue
             elif value is None:
-                properties.append(prefix + '.' + key if prefix else key)
-            elif isinstance(value, int):
-                properties.append(prefix + '.' + key if prefix else key)
+                # A null value doesn't tell the type of the field
+                properties.append((prefix + '.' + key if prefix else key, None))
+            elif isinstance(value, (int, float)):
+                properties.append((prefix + '.' + key if prefix else key, 'number'))
             elif isinstance(value, str):
-                properties.append(prefix + '.' + key if prefix else key)
+                properties.append((prefix + '.' + key if prefix else key, 'string'))
             elif isinstance(value, list):
                 properties += get_properties_of_document(value, prefix + '.' + key if prefix else key)
             elif isinstance(value, dict):
@@ -172,22 +192,32 @@ def get_properties_of_document(document, prefix="") -> List[str]:
     return properties
 
 
+def merge_value_types(value_types: set) -> str:
+    # The type of a field is the type of all its values, or 'mixed'
+    value_types = value_types - {None}
+    if not value_types:
+        return 'string'
+    return value_types.pop() if len(value_types) == 1 else 'mixed'
+
+
 def find_alphanumeric_terms_used(collection_name: str) -> List[Dict]:
     terms = []
-    terms_ids = set()
+    # The types of the values of each field, in every document
+    value_types: Dict[str, set] = {}
     count = client.beacon.get_collection(collection_name).estimated_document_count()
     xs = client.beacon.get_collection(collection_name).find()
     for r in tqdm(xs, total=count):
-        properties = get_properties_of_document(r)
-        for p in properties:
-            if p not in terms_ids:
-                terms_ids.add(p)
-                terms.append({
-                    'type': 'alphanumeric',
-                    'id': p,
-                    'count': get_alphanumeric_term_count(collection_name, p),
-                    'collection': collection_name,
-                })
+        for p, value_type in get_properties_of_document(r):
+            value_types.setdefault(p, set()).add(value_type)
+    for p, types in value_types.items():
+        terms.append({
+            'type': 'alphanumeric',
+            'id': p,
+            'count': get_alphanumeric_term_count(collection_name, p),
+            'collection': collection_name,
+            'path': p,
+            'valueType': merge_value_types(types),
+        })
     return terms
 
 
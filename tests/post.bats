@@ -43,3 +43,475 @@ load init
 
     [[ "$status" -eq 0 ]]
 }
+
+@test "POST - Individuals NA24631,NA24694" {
+
+    name="individuals-NA24631-NA24694"
+    query="${BEACON_URL}/api/individuals/NA24631,NA24694/"
+    request="requests/individuals-record.json"
+    response="responses/${name}.json"
+
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "POST - Biosamples of a list of individuals" {
+
+    query="${BEACON_URL}/api/individuals/NA24631,NA24694/biosamples/"
+    request="requests/individuals-record.json"
+
+    # A cross-entity route takes a single id: httpie exits with 4 on a 4xx
+    run http --check-status POST $query --json < $request
+
+    [[ "$status" -eq 4 ]]
+}
+
+@test "POST - Batch of queries" {
+
+    name="batch"
+    query="${BEACON_URL}/api/batch/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # Each query of the batch answers with its own status, a failing one does not fail the others
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responses[] | [.endpoint, .status, .response.responseSummary]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Pagination - Page token with a skip" {
+
+    name="variants-snp-page-2"
+    query="${BEACON_URL}/api/g_variants/"
+    request="requests/variants-snp-page.json"
+    response="responses/${name}.json"
+
+    # The token of the first page takes precedence over the skip of the request
+    token=$(http POST $query --json < $request | jq -r '.info.pagination.nextPage')
+    echo "http POST $query --json < $request (currentPage: $token, skip: 5) > ${BATS_TMPDIR}/${name}.json"
+    jq ".query.pagination += {\"currentPage\": \"$token\", \"skip\": 5}" $request | http POST $query --json | jq -S '[.responseSummary, [.response.resultSets[].results[].variantInternalId]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Pagination - Page token with a skip on the variants of an individual" {
+
+    name="individual-NA24631-variants-page-2"
+    query="${BEACON_URL}/api/individuals/NA24631/g_variants/"
+    request="requests/variants-page.json"
+    response="responses/${name}.json"
+
+    token=$(http POST $query --json < $request | jq -r '.info.pagination.nextPage')
+    echo "http POST $query --json < $request (currentPage: $token, skip: 5) > ${BATS_TMPDIR}/${name}.json"
+    jq ".query.pagination += {\"currentPage\": \"$token\", \"skip\": 5}" $request | http POST $query --json | jq -S '[.responseSummary, [.response.resultSets[].results[].variantInternalId]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Filters - Ontology term" {
+
+    name="individuals-male"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # Served by the ontology index when it is enabled, by $text otherwise
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Filters - LIKE pattern" {
+
+    name="individuals-disease-like"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # Narrowed down by the trigram index when it is enabled, the regex alone otherwise
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Filters - Numeric measure" {
+
+    name="individuals-measure"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # Served by the measures index when it is enabled, by $elemMatch otherwise
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '.responseSummary' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Cross-entity - Variants of an individual" {
+
+    name="individual-NA24631-variants-count"
+    query="${BEACON_URL}/api/individuals/NA24631/g_variants/"
+    request="requests/individuals-record.json"
+    response="responses/${name}.json"
+
+    # Served by the linkage index when it is enabled, by the join otherwise
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '.responseSummary' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Cross-entity - Variants of an unknown individual" {
+
+    name="individual-unknown-variants-count"
+    query="${BEACON_URL}/api/individuals/NA00000/g_variants/"
+    request="requests/individuals-record.json"
+    response="responses/${name}.json"
+
+    # An entry missing from the linkage index falls back to the join
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '.responseSummary' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Projection - Default schema" {
+
+    name="cohorts-schema"
+    query="${BEACON_URL}/api/cohorts/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # Requesting the default schema returns every field of the documents
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.response.collections[] | keys]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Projection - Requested fields" {
+
+    name="variants-fields"
+    query="${BEACON_URL}/api/g_variants/?fields=variantInternalId,variantType"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.response.resultSets[].results[] | keys]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Client - Count of individuals" {
+
+    name="individuals-count"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # Read with the pool, read preference and read concern of the configuration
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '.responseSummary' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Cross-entity - Individuals of a dataset" {
+
+    name="dataset-individuals"
+    query="${BEACON_URL}/api/datasets/EGAD00001008097/individuals/"
+    request="requests/individuals-record.json"
+    response="responses/${name}.json"
+
+    # The members of the dataset are cached, the second query answers the same without reading it
+    for i in 1 2; do
+        echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+        http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+        run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+        [[ "$status" -eq 0 ]]
+    done
+}
+
+@test "Semi-join - Individuals with a biosample filter" {
+
+    name="individuals-biosample-status"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # The individuals are queried on the individualId of the matching biosamples, a chunk at a time
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Semi-join - Count of variants with a biosample filter" {
+
+    name="variants-biosample-status"
+    query="${BEACON_URL}/api/g_variants/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # A variant holds several biosample ids: the _id of the matching variants are counted once
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '.responseSummary' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Filters - Two alphanumeric filters" {
+
+    name="individuals-two-filters"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # The index of the most selective clause is hinted, if several indexes can serve the query
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Index advisor - Dry run" {
+
+    # The advisor runs next to the beacon, e.g. BEACON_EXEC="docker-compose exec -T beacon"
+    exec_beacon=${BEACON_EXEC:-"docker-compose -f ../deploy/docker-compose.yml exec -T beacon"}
+
+    # A dry run creates no index: every plan with a proposed index is an estimate
+    run bash -c "$exec_beacon python -m beacon.db.advisor --json | jq -e 'all(.[]; .after.heuristic == true)'"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Pagination - First page and count of a filtered query" {
+
+    name="variants-snp-page-1"
+    query="${BEACON_URL}/api/g_variants/"
+    request="requests/variants-snp-page.json"
+    response="responses/${name}.json"
+
+    # The count of all the matches and the first page are returned by a single query
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].variantInternalId]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Granularity - Boolean with a match" {
+
+    name="variants-indel-boolean"
+    query="${BEACON_URL}/api/g_variants/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # Only the existence of a match is probed, neither a count nor a record is returned
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, .response]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Granularity - Boolean without a match" {
+
+    name="variants-mnp-boolean"
+    query="${BEACON_URL}/api/g_variants/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, .response]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Count - Exact below the approximate count threshold" {
+
+    name="variants-snp-count"
+    query="${BEACON_URL}/api/g_variants/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # A collection smaller than approximate_count_threshold is counted exactly, without an error bound
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, .info.approximateCount]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Cross-entity - Individuals of a variant" {
+
+    name="variant-individuals"
+    query="${BEACON_URL}/api/g_variants/chr21_9411318_C_T/individuals/"
+    request="requests/individuals-record.json"
+    response="responses/${name}.json"
+
+    # The variant and its individuals are joined by a $lookup on the server
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Query time budget - Complete response" {
+
+    query="${BEACON_URL}/api/g_variants/"
+    request="requests/variants-snp-page.json"
+
+    # A query answered within its time budget is complete: 200, not 206
+    run bash -c "http --print=h POST $query < $request"
+
+    [[ "$status" -eq 0 ]]
+    [[ "${lines[0]}" == "HTTP/1.1 200 OK"* ]]
+}
+
+@test "Query time budget - Boolean without a match" {
+
+    query="${BEACON_URL}/api/g_variants/"
+    request="requests/variants-mnp-boolean.json"
+
+    # No match found within the time budget is a negative answer: 200, not 504
+    run bash -c "http --print=h POST $query < $request"
+
+    [[ "$status" -eq 0 ]]
+    [[ "${lines[0]}" == "HTTP/1.1 200 OK"* ]]
+}
+
+@test "Explain - Without an admin token" {
+
+    query="${BEACON_URL}/api/explain/g_variants/"
+    request="requests/variants-snp-count.json"
+
+    # 404 when no admin token is configured, 401 without a token: httpie exits with 4 on a 4xx
+    run http --check-status POST $query --json < $request
+
+    [[ "$status" -eq 4 ]]
+}
+
+@test "Explain - With an admin token" {
+
+    [[ -n "${BEACON_ADMIN_TOKEN}" ]] || skip "BEACON_ADMIN_TOKEN is not set"
+    query="${BEACON_URL}/api/explain/g_variants/"
+    request="requests/variants-snp-count.json"
+
+    # The plans of the queries sent for the request, with the statistics of the plan cache
+    run bash -c "http --check-status POST $query 'Authorization:Bearer ${BEACON_ADMIN_TOKEN}' --json < $request | jq -e '.endpoint == \"/api/g_variants/\" and .granularity == \"count\" and (.operations | length > 0) and .planCache != null'"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Plan cache - Same filter with another value" {
+
+    query="${BEACON_URL}/api/g_variants/"
+
+    # The plan compiled for the first filter is not reused for a different value
+    for name in variants-snp-count variants-indel-count variants-snp-count; do
+        request="requests/${name}.json"
+        response="responses/${name}.json"
+        echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+        http POST $query --json < $request | jq -S '[.responseSummary, .info.approximateCount]' > "${BATS_TMPDIR}/${name}.json"
+        run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+        [[ "$status" -eq 0 ]]
+    done
+}
+
+@test "Filters - Alphanumeric filter on a field" {
+
+    name="individuals-sex-female"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Filters - Alphanumeric filter on a field only matches that field" {
+
+    name="individuals-ethnicity-na24631"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # NA24631 is the id of an individual, not an ethnicity
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Filters - Count with two ontology terms" {
+
+    name="individuals-male-han-count"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # Counted as the intersection of the bitmaps of the terms when the bitmap engine is enabled
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '.responseSummary' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Filters - Filter scoped to the individuals on the variants" {
+
+    name="variants-individual-female-count"
+    query="${BEACON_URL}/api/g_variants/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # The filter is compiled on the fields of the individuals, then joined to their variants
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '.responseSummary' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}
+
+@test "Filters - Negated alphanumeric filter" {
+
+    name="individuals-not-migraine"
+    query="${BEACON_URL}/api/individuals/"
+    request="requests/${name}.json"
+    response="responses/${name}.json"
+
+    # Evaluated as the complement of the positive filter, which can use the index of the field
+    echo "http POST $query --json < $request > ${BATS_TMPDIR}/${name}.json"
+    http POST $query --json < $request | jq -S '[.responseSummary, [.response.resultSets[].results[].id]]' > "${BATS_TMPDIR}/${name}.json"
+    run diff "${BATS_TMPDIR}/${name}.json" "${response}"
+
+    [[ "$status" -eq 0 ]]
+}